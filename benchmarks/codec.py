@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmark for the JSON codecs.  Times encoding App objects as update
+requests, and decoding list_apps response bodies into App objects, with
+each codec available.
+"""
+
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openchannel as oc
+
+from models import app
+
+def main():
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    codecs = [oc.JsonCodec()]
+    if oc.orjson != None:
+        codecs.append(oc.OrjsonCodec())
+
+    body = oc.JsonCodec().encode({ "list": [app(i) for i in range(count)] })
+
+    # Apps as callers update them, with nested members materialised.
+    apps = [oc.App().parse(app(i)) for i in range(count)]
+    for a in apps:
+        a.customData.summary = "Changed"
+        for m in a.model:
+            m.price = 300
+
+    results = {}
+
+    for codec in codecs:
+
+        def encode():
+            for a in apps:
+                codec.encode(a)
+
+        def decode():
+            [oc.App().parse(v) for v in codec.decode(body)["list"]]
+
+        enc = min(timeit.repeat(encode, number=1, repeat=5))
+        dec = min(timeit.repeat(decode, number=1, repeat=5))
+
+        results[codec.name] = {
+            "apps": count,
+            "encode_us_per_app": 1e6 * enc / count,
+            "decode_us_per_app": 1e6 * dec / count,
+            "body_bytes": len(body),
+        }
+
+    print(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
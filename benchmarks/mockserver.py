@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+
+"""
+In-process mock of the OpenChannel API, for benchmarks.  Serves generated
+apps, users, developers, ownership, transactions, reviews, stats and file
+uploads from a local HTTP server, with configurable latency, list sizes,
+payload sizes and error rate.
+
+    with MockServer(latency=0.02, items=500) as server:
+        cli = oc.Client("marketplace", "secret")
+        cli.base = server.url
+
+Run on its own, it serves until interrupted:
+
+    mockserver.py [port]
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import random
+import threading
+import http.server
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from models import app
+
+def user(i):
+    return {
+        "userId": str(i), "name": "User %d" % i,
+        "email": "user%d@example.org" % i, "groupId": "g%d" % (i % 20),
+        "created": 1530000000000 + i,
+        "lastUpdated": 1540000000000 + i,
+        "customData": { "companyName": "Company %d" % (i % 100) },
+    }
+
+def developer(i):
+    return {
+        "developerId": str(i), "name": "Developer %d" % i,
+        "email": "dev%d@example.org" % i, "groupId": "g%d" % (i % 20),
+        "created": 1530000000000 + i,
+        "lastUpdated": 1540000000000 + i,
+        "customData": { "companyName": "Company %d" % (i % 100) },
+    }
+
+def ownership(i):
+    return {
+        "ownershipId": "o%012d" % i, "appId": app(i % 500)["appId"],
+        "userId": str(i % 10000), "developerId": str(i % 50),
+        "modelId": "m%d-0" % (i % 500), "date": 1540000000000 + i * 1000,
+        "productKey": "KEY-%012d" % i, "ownershipType": "full",
+        "ownershipStatus": "active", "customData": {},
+    }
+
+def transaction(i):
+    return {
+        "transactionId": "t%012d" % i, "ownershipId": "o%012d" % (i // 3),
+        "appId": app(i % 500)["appId"], "userId": str(i % 10000),
+        "developerId": str(i % 50), "date": 1540000000000 + i * 1000,
+        "amount": 200 + i % 100, "feeAmount": 30, "marketplaceAmount": 20,
+        "currency": "USD", "type": "payment",
+        "customData": { "billing": "online", "reference": "ref-%d" % i },
+    }
+
+def review(i):
+    return {
+        "reviewId": "r%012d" % i, "appId": app(i % 500)["appId"],
+        "userId": str(i % 10000), "rating": 100 * (1 + i % 5),
+        "headline": "Review %d" % i, "description": "Fine. " * 20,
+        "date": 1540000000000 + i * 1000, "lastUpdated": 1540000000000 + i,
+        "customData": {},
+    }
+
+class MockServer:
+    """
+    Serves the mock API on 127.0.0.1 from a background thread.
+
+    latency (seconds) plus up to jitter is slept before each response.
+    items is the length of every list, served page rows at a time unless
+    the client asks for another limit, as the real API pages by default.
+    payload is the size in bytes of each app's description, and error_rate
+    the fraction of requests answered 503 with Retry-After: 0.
+    """
+
+    # Collection name: (generator, id member)
+    collections = {
+        "apps": (app, "appId"),
+        "users": (user, "userId"),
+        "developers": (developer, "developerId"),
+        "ownership": (ownership, "ownershipId"),
+        "transactions": (transaction, "transactionId"),
+        "reviews": (review, "reviewId"),
+    }
+
+    def __init__(self, latency=0.0, jitter=0.0, items=100, payload=1280,
+                 error_rate=0.0, port=0, seed=0, page=100):
+        self.latency = latency
+        self.jitter = jitter
+        self.items = items
+        self.page = page
+        self.payload = payload
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bodies = {}
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", port), self.handler()
+        )
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/v2" % self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stats(self):
+        with self.lock:
+            return { "requests": self.requests, "errors": self.errors }
+
+    def record(self, kind, i):
+        data = self.collections[kind][0](i)
+        if kind == "apps":
+            data["customData"]["description"] = "x" * self.payload
+        return data
+
+    def find(self, kind, id):
+        # Generated ids end with the record's index.
+        match = re.search(r"(\d+)$", id)
+        i = int(match.group(1)) if match else 0
+        return self.record(kind, i % self.items)
+
+    def listing(self, kind, params):
+        limit = int(params.get("limit", [self.page])[0])
+        page = int(params.get("pageNumber", ["1"])[0])
+        start = (page - 1) * limit
+        end = min(start + limit, self.items)
+        return {
+            "count": self.items, "pages": (self.items + limit - 1) // limit,
+            "pageNumber": page,
+            "list": [self.record(kind, i) for i in range(start, end)],
+        }
+
+    def stats_series(self, params):
+        start = int(params.get("start", ["0"])[0])
+        end = int(params.get("end", ["0"])[0])
+        step = 86400000
+        first = (start + step - 1) // step * step
+        return [[t, (t // step) % 17] for t in range(first, end, step)]
+
+    def stats_total(self):
+        return {
+            "apps": {
+                self.record("apps", i)["appId"]: {
+                    "views": i * 10, "downloads": i,
+                } for i in range(self.items)
+            },
+        }
+
+    def get(self, path, params):
+        """
+        Returns the response to a GET, as JSON-able data.
+        """
+
+        parts = path.split("/")[2:]
+        kind = parts[0] if parts else ""
+
+        if kind == "stats":
+            if parts[1:2] == ["series"]:
+                return self.stats_series(params)
+            return self.stats_total()
+
+        if kind == "apps" and parts[1:2] == ["versions"]:
+            return self.listing("apps", params)
+
+        if kind == "apps" and parts[1:2] == ["bySafeName"]:
+            return self.record("apps", 0)
+
+        if kind == "markets":
+            return { "marketplaceId": "mock", "name": "Mock market" }
+
+        if kind in ("users", "developers") and parts[1:2] == ["groups"]:
+            return { "groupId": parts[2], "customData": {} }
+
+        if kind not in self.collections:
+            return None
+
+        if len(parts) == 1:
+            return self.listing(kind, params)
+
+        return self.find(kind, parts[1])
+
+    def post(self, path, body):
+        """
+        Returns the response to a POST, as JSON-able data.
+        """
+
+        parts = path.split("/")[2:]
+
+        if parts == ["files"] or parts == ["files", "url"]:
+            return {
+                "fileId": "f%d" % self.requests,
+                "fileUrl": "https://example.org/files/%d" % self.requests,
+                "size": len(body),
+            }
+
+        if parts[:2] == ["ownership", "install"]:
+            data = ownership(0)
+            data.update(json.loads(body))
+            return data
+
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            data = {}
+        return data
+
+    def handler(self):
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            # Send each response in one write, with Nagle off, otherwise
+            # delayed ACKs add 40ms to every request.
+            wbufsize = 65536
+            disable_nagle_algorithm = True
+
+            def reply(self, code, body, headers={}):
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def handle_request(self, method):
+
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+
+                with server.lock:
+                    server.requests += 1
+                    delay = server.latency
+                    if server.jitter > 0:
+                        delay += server.random.uniform(0, server.jitter)
+                    fail = server.random.random() < server.error_rate
+                    if fail:
+                        server.errors += 1
+
+                if delay > 0:
+                    time.sleep(delay)
+
+                if fail:
+                    self.reply(503, b'{"error":"unavailable"}',
+                               { "Retry-After": "0" })
+                    return
+
+                url = urllib.parse.urlsplit(self.path)
+                params = urllib.parse.parse_qs(url.query)
+
+                if method == "GET":
+                    body = server.bodies.get(self.path)
+                    if body == None:
+                        data = server.get(url.path, params)
+                        if data == None:
+                            self.reply(404, b'{"error":"not found"}')
+                            return
+                        body = json.dumps(data).encode("utf-8")
+                        server.bodies[self.path] = body
+                elif method == "POST":
+                    body = json.dumps(server.post(url.path, body))
+                    body = body.encode("utf-8")
+                else:
+                    body = b"{}"
+
+                self.reply(200, body)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def do_DELETE(self):
+                self.handle_request("DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    server = MockServer(port=port)
+    print("Serving on %s" % server.url)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
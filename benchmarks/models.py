@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+Memory benchmark for the model classes.  Parses a list_apps-sized batch of
+realistic app payloads and compares the heap held by lazily parsed App
+objects against the same apps with every nested member materialised, which
+is what App.parse used to build up front.
+"""
+
+import os
+import sys
+import json
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openchannel as oc
+
+def app(i):
+    return {
+        "appId": "5b2c7d%018d" % i,
+        "name": "App number %d" % i,
+        "safeName": ["app-number-%d" % i],
+        "developerId": str(i % 50),
+        "version": 3,
+        "created": 1530000000000 + i,
+        "lastUpdated": 1540000000000 + i,
+        "access": ["steal-secrets", "encrypt-files"],
+        "status": { "value": "approved", "lastUpdated": 1540000000000 },
+        "statistics": {
+            "views": { "total": i * 10, "90day": i, "30day": i },
+            "downloads": { "total": i, "90day": i, "30day": i },
+        },
+        "customData": {
+            "summary": "Summary of app %d" % i,
+            "description": "A long description of the app. " * 40,
+            "icon": "https://example.org/icons/%d.png" % i,
+            "category": ["cybersecurity", "monitoring"],
+            "images": ["https://example.org/img/%d/%d.png" % (i, j)
+                       for j in range(5)],
+            "video": ["https://www.youtube.com/watch?v=K7CnMQ4L9Pc"],
+        },
+        "model": [
+            {
+                "modelId": "m%d-%d" % (i, j), "type": "single",
+                "price": 200, "currency": "USD", "license": "single",
+                "customData": { "billing": "online" },
+            } for j in range(2)
+        ],
+    }
+
+def measure(body, touch):
+
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    apps = [oc.App().parse(v) for v in json.loads(body)["list"]]
+    if touch:
+        for a in apps:
+            a.customData, a.status, a.statistics
+            for m in a.model:
+                m.customData
+
+    elapsed = time.perf_counter() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return size, peak, elapsed
+
+def main():
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    body = json.dumps({ "list": [app(i) for i in range(count)] })
+
+    results = {}
+    for name, touch in [("lazy", False), ("eager", True)]:
+        size, peak, elapsed = measure(body, touch)
+        results[name] = {
+            "apps": count, "held_bytes": size, "peak_bytes": peak,
+            "bytes_per_app": size // count, "seconds": elapsed,
+        }
+
+    print(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Throughput benchmark for record/replay.  Records a mix of get_app,
+get_user and list_apps calls against the mock server, then makes the same
+calls many times over from the cassette, reporting requests/second live
+and replayed, and the cassette size.
+
+    replay.py [requests] [round-trip-ms]
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import openchannel as oc
+
+from mockserver import MockServer
+
+def calls(cli, count):
+    for i in range(count):
+        if i % 10 == 0:
+            cli.list_apps()
+        elif i % 2 == 0:
+            cli.get_app("%018d" % (i % 100))
+        else:
+            cli.get_user(str(i % 100))
+
+def rate(cli, count):
+    start = time.perf_counter()
+    calls(cli, count)
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+def main():
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0
+
+    path = os.path.join(tempfile.mkdtemp(), "cassette.jsonl.gz")
+
+    with MockServer(latency=latency, items=50) as server:
+
+        cli = oc.Client("marketplace", "secret")
+        cli.base = server.url
+        live = rate(cli, 1000)
+
+        cli.transport = oc.RecordingTransport(cli.transport, path)
+        calls(cli, 200)
+        recorded = cli.transport.count
+        cli.transport.close()
+
+    replay = oc.ReplayTransport(path)
+    cli = oc.Client("marketplace", "secret", transport=replay)
+    cli.base = server.url
+    replayed = rate(cli, count)
+
+    print(json.dumps({
+        "live_requests_per_second": live,
+        "recorded": recorded,
+        "cassette_bytes": os.path.getsize(path),
+        "replayed": count,
+        "replay_requests_per_second": replayed,
+        "replay": replay.stats(),
+    }, indent=4))
+
+if __name__ == "__main__":
+    main()
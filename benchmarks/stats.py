@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Latency benchmark for StatsAggregator.  A client whose get_stats_series
+sleeps for a simulated round-trip time, plus a cost per bucket returned,
+serves hourly buckets for a set of apps.  Compares a cold query (fetching the whole window, as a dashboard
+calling the API each time does), a refresh of an aggregator which already
+holds the window, and answering the sliding-window total locally.
+
+    stats.py [apps] [round-trip-ms] [bucket-us]
+"""
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openchannel as oc
+
+HOUR = 3600000
+
+def client(latency, cost):
+
+    cli = oc.Client("marketplace", "secret", max_workers=16)
+
+    def get_stats_series(start, end, query=None, field=None, period="day"):
+        first = (start + HOUR - 1) // HOUR * HOUR
+        rows = [[t, (t // HOUR) % 7] for t in range(first, end, HOUR)]
+        time.sleep(latency + cost * len(rows))
+        return rows
+
+    cli.get_stats_series = get_stats_series
+    return cli
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for i in range(repeat):
+        value = fn()
+    return (time.perf_counter() - start) / repeat, value
+
+def main():
+
+    apps = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+    cost = float(sys.argv[3]) / 1e6 if len(sys.argv) > 3 else 500e-6
+
+    cli = client(latency, cost)
+    ids = ["app%d" % i for i in range(apps)]
+
+    cold, buckets = timed(lambda: oc.StatsAggregator(
+        cli, apps=ids, retain=7 * 86400
+    ).refresh())
+
+    agg = oc.StatsAggregator(cli, apps=ids, retain=7 * 86400)
+    agg.refresh(time.time() - 60)
+    refresh, fetched = timed(agg.refresh)
+
+    local, total = timed(lambda: agg.totals(86400), repeat=1000)
+    one, value = timed(lambda: agg.total("views", 3600, ids[0]),
+                       repeat=10000)
+
+    print(json.dumps({
+        "apps": apps, "round_trip_ms": latency * 1000,
+        "bucket_us": cost * 1e6,
+        "cold_query_ms": cold * 1000, "cold_buckets": buckets,
+        "refresh_ms": refresh * 1000, "refresh_buckets": fetched,
+        "local_totals_us": local * 1e6, "local_app_total_us": one * 1e6,
+    }, indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+Peak memory benchmark for streamed list responses.  Serves a large
+transactions list from a local HTTP server and reads it in a fresh process
+each way, with list_transactions (whole body decoded, then every object
+built) and with stream_transactions (objects built as the body arrives),
+reporting the peak RSS of each.
+
+    stream.py [rows]
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import subprocess
+import http.server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openchannel as oc
+
+def transaction(i):
+    return {
+        "transactionId": "t%012d" % i,
+        "ownershipId": "o%012d" % (i // 3),
+        "appId": "5b2c7d%018d" % (i % 500),
+        "userId": str(i % 10000),
+        "developerId": str(i % 50),
+        "date": 1540000000000 + i * 1000,
+        "amount": 200 + i % 100,
+        "feeAmount": 30,
+        "marketplaceAmount": 20,
+        "currency": "USD",
+        "type": "payment",
+        "customData": { "billing": "online", "reference": "ref-%d" % i },
+    }
+
+def serve(rows):
+
+    body = json.dumps({
+        "count": rows, "pages": 1, "pageNumber": 1,
+        "list": [transaction(i) for i in range(rows)],
+    }).encode("utf-8")
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            for i in range(0, len(body), 65536):
+                self.wfile.write(body[i:i + 65536])
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, len(body)
+
+def child(mode, port):
+
+    cli = oc.Client("marketplace", "secret")
+    cli.base = "http://127.0.0.1:%d" % port
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+
+    if mode == "list":
+        rows = len(cli.list_transactions())
+    else:
+        rows = sum(1 for t in cli.stream_transactions())
+
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in kB on Linux.
+    print(json.dumps({
+        "rows": rows, "seconds": elapsed,
+        "baseline_rss_kb": before, "peak_rss_kb": peak,
+        "growth_kb": peak - before,
+    }))
+
+def main():
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        child(sys.argv[2], int(sys.argv[3]))
+        return
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--serve":
+        server, size = serve(int(sys.argv[2]))
+        print(server.server_address[1], size, flush=True)
+        sys.stdin.read()
+        return
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    # The server runs in a process of its own, as peak RSS is inherited
+    # through fork and the readers must start out small.
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", str(rows)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    port, size = [int(v) for v in server.stdout.readline().split()]
+
+    results = { "rows": rows, "body_bytes": size }
+    try:
+        for mode in ["list", "stream"]:
+            out = subprocess.check_output([
+                sys.executable, __file__, "--child", mode, str(port)
+            ])
+            results[mode] = json.loads(out)
+    finally:
+        server.stdin.close()
+        server.wait()
+
+    print(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
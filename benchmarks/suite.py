@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark suite, run against the mock server in mockserver.py so that no
+network or real marketplace is needed.  Each workload is timed for
+throughput and per-call p50/p99 latency, then run again under tracemalloc
+for its peak Python heap (which includes the in-process server's share).
+Calls which fail, e.g. uploads given a 503 by --error-rate, which can't
+safely be retried, are counted rather than ending the run.  Results are
+printed as JSON, for comparing one version against another:
+
+    suite.py --latency 5 --items 500 > before.json
+
+Workloads:
+    list     list_apps, list_users, list_transactions
+    iter     iter_apps over pages of --page-size
+    get      get_app, get_user, get_developer one after another
+    bulk     get_apps and get_users over --ops ids
+    update   update_users with partial updates
+    stats    get_stats_total and get_stats_series
+    upload   upload_file of --upload-size bytes
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import openchannel as oc
+
+from mockserver import MockServer
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+# Workloads return a (seconds, ok) pair per call.
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    try:
+        fn(*args)
+        ok = True
+    except oc.ApiError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+def workload_list(cli, args):
+    calls = [cli.list_apps, cli.list_users, cli.list_transactions]
+    return [timed(calls[i % len(calls)]) for i in range(args.ops // 10 or 1)]
+
+def workload_iter(cli, args):
+    times = []
+    last = time.perf_counter()
+    try:
+        for i, v in enumerate(cli.iter_apps(limit=args.page_size)):
+            if (i + 1) % args.page_size == 0:
+                now = time.perf_counter()
+                times.append((now - last, True))
+                last = now
+    except oc.ApiError:
+        times.append((time.perf_counter() - last, False))
+    return times
+
+def workload_get(cli, args):
+    calls = [cli.get_app, cli.get_user, cli.get_developer]
+    return [
+        timed(calls[i % len(calls)], "%018d" % i) for i in range(args.ops)
+    ]
+
+def workload_bulk(cli, args):
+    ids = ["%018d" % i for i in range(args.ops)]
+    results = cli.get_apps(ids) + cli.get_users(ids)
+    return [(r.seconds, r.ok()) for r in results]
+
+def workload_update(cli, args):
+
+    def users():
+        for i in range(args.ops):
+            u = oc.User(client=cli).parse({ "userId": str(i) })
+            u.name = "Renamed %d" % i
+            yield u
+
+    report = cli.update_users(users(), partial=True)
+    return [(res.seconds, res.ok()) for res in report]
+
+def workload_stats(cli, args):
+    end = 1700000000000
+    start = end - 90 * 86400000
+    return [
+        timed(cli.get_stats_total, start, end) if i % 2 == 0 else
+        timed(cli.get_stats_series, start, end, {}, "views")
+        for i in range(args.ops // 10 or 1)
+    ]
+
+def workload_upload(cli, args):
+    data = b"x" * args.upload_size
+    return [
+        timed(cli.upload_file, "file%d" % i, data)
+        for i in range(args.ops // 10 or 1)
+    ]
+
+workloads = {
+    "list": workload_list,
+    "iter": workload_iter,
+    "get": workload_get,
+    "bulk": workload_bulk,
+    "update": workload_update,
+    "stats": workload_stats,
+    "upload": workload_upload,
+}
+
+def client(server, args):
+    retry = None
+    if args.error_rate > 0:
+        retry = oc.RetryPolicy(max_attempts=10, backoff=0.001)
+    cli = oc.Client("marketplace", "secret", max_workers=args.workers,
+                    pool_maxsize=args.workers, retry=retry)
+    cli.base = server.url
+    return cli
+
+def run(name, server, args):
+
+    cli = client(server, args)
+    before = server.stats()["requests"]
+    start = time.perf_counter()
+    calls = workloads[name](cli, args)
+    elapsed = time.perf_counter() - start
+    requests = server.stats()["requests"] - before
+    times = [seconds for seconds, ok in calls]
+
+    result = {
+        "calls": len(times),
+        "failures": len([ok for seconds, ok in calls if not ok]),
+        "requests": requests,
+        "seconds": elapsed,
+        "calls_per_second": len(times) / elapsed if elapsed > 0 else 0.0,
+        "requests_per_second": requests / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": 1000 * percentile(times, 0.5),
+        "p99_ms": 1000 * percentile(times, 0.99),
+        "retries": cli.retry_stats()["retries"],
+    }
+
+    if args.memory:
+        cli = client(server, args)
+        tracemalloc.start()
+        workloads[name](cli, args)
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("workloads", nargs="*", default=list(workloads),
+                        help="workloads to run, default all")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="server latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="extra random latency in ms, up to")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests failed with a 503")
+    parser.add_argument("--items", type=int, default=100,
+                        help="length of each list, paged 100 at a time")
+    parser.add_argument("--payload", type=int, default=1280,
+                        help="bytes of description per app")
+    parser.add_argument("--ops", type=int, default=200,
+                        help="calls per get, bulk and update workload")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--upload-size", type=int, default=1 << 20)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write results here, not stdout")
+    args = parser.parse_args()
+
+    for name in args.workloads:
+        if name not in workloads:
+            parser.error("unknown workload %s" % name)
+
+    server = MockServer(
+        latency=args.latency / 1000, jitter=args.jitter / 1000,
+        items=args.items, payload=args.payload, error_rate=args.error_rate,
+    ).start()
+
+    results = {
+        "python": platform.python_version(),
+        "codec": oc.default_codec().name,
+        "config": {
+            k: v for k, v in vars(args).items()
+            if k not in ("workloads", "output")
+        },
+        "workloads": {},
+    }
+
+    # Whatever has been measured is written out, even if a workload
+    # raises or the run is interrupted.
+    try:
+        for name in args.workloads:
+            try:
+                results["workloads"][name] = run(name, server, args)
+            except Exception as e:
+                results["workloads"][name] = {
+                    "error": "%s: %s" % (type(e).__name__, e)
+                }
+    finally:
+        server.stop()
+        out = json.dumps(results, indent=4)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(out + "\n")
+        else:
+            print(out)
+
+if __name__ == "__main__":
+    main()
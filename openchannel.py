@@ -4,42 +4,274 @@ Python API for openchannel.io
 """
 
 import requests
+import urllib3
+import urllib.parse
 import json
 import time
+import concurrent.futures
+import collections
+import threading
+import copy
+import random
+import email.utils
+import datetime
+import functools
+import bisect
+import os
+import re
+import io
+import codecs
+import csv
+import gzip
+import base64
+import mmap
+import uuid
+import hashlib
+import sqlite3
+import array
+import asyncio
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 class ApiError(Exception):
     """
     Exception encapsulating an error in the Openchannel API.  Member
     code is the HTTP status code, value is the error message.
     """
-    def __init__(self, code, value):
+    def __init__(self, code, value, retries=0, response=None):
         """
-        Constructor, code=HTTP status code, value=error message
+        Constructor, code=HTTP status code, value=error message,
+        retries=number of retries made before giving up.
         """
         self.code = code
         self.value = value
+        self.retries = retries
+        self.response = response
     def __str__(self):
         return "%s: %s" % (repr(self.code), repr(self.value))
 
+def encode_default(value):
+    """
+    JSON encoder hook, encodes objects as their members.  Nested objects
+    are found by the encoder as it goes, so the payload is built in one
+    pass rather than being copied into dicts first.
+    """
+    if isinstance(value, Obj):
+        return value.fields()
+    raise TypeError("%s is not JSON serializable" % type(value).__name__)
+
+def plain(value):
+    """
+    Converts objects within value to plain dicts.
+    """
+    if isinstance(value, Obj):
+        value = value.fields()
+    if isinstance(value, dict):
+        return {k: plain(value[k]) for k in value}
+    if isinstance(value, list):
+        return [plain(v) for v in value]
+    return value
+
+def is_dirty(value):
+    """
+    Returns True if value is an Obj, or list containing one, with changes.
+    """
+    if isinstance(value, Obj):
+        return value.dirty()
+    if isinstance(value, list):
+        for v in value:
+            if isinstance(v, Obj) and v.dirty():
+                return True
+    return False
+
+class JsonCodec:
+    """
+    Encodes requests and decodes responses with the standard library json
+    module.
+    """
+    name = "json"
+    def encode(self, value):
+        """
+        Returns value as UTF-8 JSON bytes.
+        """
+        return json.dumps(value, default=encode_default,
+                          separators=(",", ":")).encode("utf-8")
+    def decode(self, data):
+        """
+        Decodes JSON from bytes.
+        """
+        return json.loads(data)
+
+class OrjsonCodec(JsonCodec):
+    """
+    Codec using orjson, which is several times faster than json.
+    """
+    name = "orjson"
+    def encode(self, value):
+        return orjson.dumps(value, default=encode_default)
+    def decode(self, data):
+        return orjson.loads(data)
+
+def default_codec():
+    """
+    Returns the fastest codec available.
+    """
+    if orjson != None:
+        return OrjsonCodec()
+    return JsonCodec()
+
 class Obj:
     """
     Base class for a number of openchannel objects, encapsulates standard
     JSON parsing, and string conversion.
+
+    Members named in nested are turned into objects by the function given
+    there, but not until they are first accessed: until then the parsed
+    JSON is kept as it is in _lazy.  Most callers of e.g. list_apps only
+    look at a few members, so this saves building (and holding) objects
+    nobody uses.
+
+    Once parsed, an object records in _changed the members assigned to
+    since, see changes().
     """
+    nested = {}
+
+    # Bookkeeping members, which aren't part of the API object.
+    private = ("client", "_lazy", "_changed")
+
     def __init__(self, client=None):
         if client != None: self.client=client
     def parse(self, data):
+        fields = self.__dict__
         for v in data:
-            setattr(self, v, data[v])
+            if v in self.nested:
+                if "_lazy" not in fields:
+                    fields["_lazy"] = {}
+                fields["_lazy"][v] = data[v]
+                # Drop any default set by the constructor.
+                fields.pop(v, None)
+            else:
+                fields[v] = data[v]
+        fields["_changed"] = set()
         return self
+
+    def __getattr__(self, name):
+        lazy = self.__dict__.get("_lazy")
+        if lazy == None or name not in lazy:
+            raise AttributeError(name)
+        value = self.nested[name](lazy.pop(name))
+        self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name, value):
+        # An assignment replaces any unparsed value, which fields() would
+        # otherwise send instead.
+        lazy = self.__dict__.get("_lazy")
+        if lazy != None:
+            lazy.pop(name, None)
+        self.__dict__[name] = value
+        changed = self.__dict__.get("_changed")
+        if changed != None and name not in self.private:
+            changed.add(name)
+
+    def __delattr__(self, name):
+        lazy = self.__dict__.get("_lazy")
+        found = lazy != None and name in lazy
+        if found:
+            del lazy[name]
+        if name in self.__dict__:
+            del self.__dict__[name]
+        elif not found:
+            raise AttributeError(name)
+
+    def fields(self):
+        """
+        Returns the members as a dict, without the client.  Nested members
+        which haven't been accessed are returned as their parsed JSON.
+        """
+        res = {
+            v: self.__dict__[v] for v in self.__dict__
+            if v not in self.private
+        }
+        if "_lazy" in self.__dict__:
+            res.update(self._lazy)
+        return res
+
+    def dirty(self):
+        """
+        Returns True if the object has changes to send: for a parsed object,
+        if any member was assigned or a nested object is dirty, otherwise
+        if it has any members at all.
+        """
+        changed = self.__dict__.get("_changed")
+        if changed == None:
+            return len(self.fields()) > 0
+        if len(changed) > 0:
+            return True
+        for v in self.__dict__:
+            if v not in self.private and is_dirty(self.__dict__[v]):
+                return True
+        return False
+
+    def changes(self):
+        """
+        Returns the members changed since the object was parsed, as a dict,
+        i.e. the body of a partial update.  Nested objects (and lists of
+        them) are included whole if anything in them changed.  Changes made
+        inside a list or dict member, e.g. app.customData.images.append(),
+        aren't seen unless the member is assigned afterwards.  An object
+        which wasn't parsed returns all its members.
+        """
+        changed = self.__dict__.get("_changed")
+        if changed == None:
+            return self.fields()
+        res = {}
+        for v in self.__dict__:
+            if v in self.private:
+                continue
+            value = self.__dict__[v]
+            if v in changed or is_dirty(value):
+                res[v] = value
+        return res
+
+    def dict(self):
+        """
+        Returns the object as plain dicts and lists.
+        """
+        return plain(self)
+
     def __str__(self):
-        return str({v: getattr(self, v) for v in self.__dict__})
+        return str(self.fields())
 
     def encode(self):
-        res = {v: getattr(self, v) for v in self.__dict__}
-        if "client" in res:
-            del res["client"]
-        return json.dumps(res)
+        """
+        Encodes to JSON
+        """
+        return json.dumps(self, default=encode_default)
 
 class CustomData(Obj):
     """
@@ -51,35 +283,13 @@ class ObjCD(Obj):
     """
     Base class for anything with custom data
     """
+    nested = {
+        "customData": lambda data: CustomData().parse(data)
+    }
+
     def __init__(self, client=None):
         Obj.__init__(self, client)
         self.customData = CustomData()
-    def parse(self, data):
-        """
-        Initialises an app with data, data should be the output of
-        requests json() method.
-        """
-        for v in data:
-            if v == "customData":
-                self.customData = CustomData().parse(data[v])
-            else:
-                setattr(self, v, data[v])
-        return self
-
-    def encode(self):
-        res = {v: getattr(self, v) for v in self.__dict__}
-        res["customData"] = self.customData.__dict__
-        if "client" in res:
-            del res["client"]
-        return json.dumps(res)
-
-    # This is a hack to get app.model to encode properly.
-    def dict(self):
-        res = {v: getattr(self, v) for v in self.__dict__}
-        res["customData"] = self.customData.__dict__
-        if "client" in res:
-            del res["client"]
-        return res
         
 
 class File(Obj):
@@ -113,15 +323,15 @@ class Ownership(ObjCD):
     """
     Represents ownership of an app
     """
-    def update(self):
-        return self.client.update_ownership(self)
+    def update(self, partial=False):
+        return self.client.update_ownership(self, partial)
 
 class Transaction(ObjCD):
     """
     Represents ownership of an app
     """
-    def update(self):
-        return self.client.update_transaction(self)
+    def update(self, partial=False):
+        return self.client.update_transaction(self, partial)
     def delete(self):
         return self.client.delete_transaction(self)
 
@@ -134,11 +344,11 @@ class Review(ObjCD):
         Creates a review
         """
         return self.client.create_review(self)
-    def update(self):
+    def update(self, partial=False):
         """
-        Updates a review
+        Updates a review, with partial=True sending only changed members.
         """
-        return self.client.update_review(self)
+        return self.client.update_review(self, partial)
 
 class Stats(Obj):
     """
@@ -168,6 +378,13 @@ class App(Obj):
     """
     Encapsulates an app
     """
+    nested = {
+        "customData": lambda data: CustomData().parse(data),
+        "status": lambda data: Status().parse(data),
+        "statistics": lambda data: Statistics().parse(data),
+        "model": lambda data: [Model().parse(m) for m in data],
+    }
+
     def __init__(self, client=None):
         """
         Constructor, client handle can be passed in.
@@ -175,45 +392,11 @@ class App(Obj):
         Obj.__init__(self, client)
         self.customData = CustomData()
 
-    def parse(self, data):
-        """
-        Initialises an app with data, data should be the output of
-        requests json() method.
-        """
-        for v in data:
-            if v == "customData":
-                self.customData = CustomData().parse(data[v])
-            elif v == "status":
-                self.status = Status().parse(data[v])
-            elif v == "statistics":
-                self.statistics = Statistics().parse(data[v])
-            elif v == "model":
-                self.model = [Model().parse(m) for m in data["model"]]
-            else:
-                setattr(self, v, data[v])
-
-        # Helps list comprehensions if we return the app object.
-        return self
-
-    def encode(self):
-        """
-        Encodes to JSON
-        """
-        res = {v: getattr(self, v) for v in self.__dict__}
-        res["customData"] = self.customData.__dict__
-        if "status" in self.__dict__:
-            res["status"] = self.status.__dict__
-        if "model" in self.__dict__:
-            res["model"] = [v.dict() for v in self.model]
-        if "client" in res:
-            del res["client"]
-        return json.dumps(res)
-
     def delete(self):
         """
         Deletes an app
         """
-        self.client.delete_app(self)
+        return self.client.delete_app(self)
 
     def create(self):
         """
@@ -221,45 +404,47 @@ class App(Obj):
         """
         return self.client.create_app(self)
 
-    def update(self, version):
+    def update(self, version, partial=False):
         """
-        Updates an app's draft form.
+        Updates an app's draft form, with partial=True sending only the
+        members changed since it was fetched (see changes()).
         """
-        return self.client.update_app(self, version)
+        return self.client.update_app(self, version, partial)
 
     def publish_version(self, version, autoApprove=False):
         """
         Publishes an app's version
         """
-        self.client.publish_app_version(self, version, autoApprove)
+        return self.client.publish_app_version(self, version, autoApprove)
 
     def delete_version(self, version):
         """
         Deletes an app version
         """
-        self.client.delete_app_version(self, version)
+        return self.client.delete_app_version(self, version)
 
     def change_live_version(self, version):
         """
         Changes the live version to a previously published form
         """
-        self.client.change_live_version(self, version)
+        return self.client.change_live_version(self, version)
 
     def status_change(self, status, reason):
         """
         Changes an app's status, status=suspend/unsuspend
         """
-        self.client.status_change(self, status, reason)
+        return self.client.status_change(self, status, reason)
 
 class Developer(ObjCD):
     """
     Encapsulates an app developer
     """
-    def update(self):
+    def update(self, partial=False):
         """
-        Create/update a developer
+        Create/update a developer, with partial=True sending only changed
+        members.
         """
-        return self.client.update_developer(self)
+        return self.client.update_developer(self, partial)
 
     def create(self):
         """
@@ -271,11 +456,12 @@ class User(ObjCD):
     """
     Encapsulates an app user
     """
-    def update(self):
+    def update(self, partial=False):
         """
-        Create/update a user
+        Create/update a user, with partial=True sending only changed
+        members.
         """
-        return self.client.update_user(self)
+        return self.client.update_user(self, partial)
 
     def create(self):
         """
@@ -303,36 +489,4303 @@ class UserGroup(ObjCD):
     def create(self):
         return self.client.update_user_group(self)
 
-class Client:
+class Cache:
     """
-    Encapsulates an openchannel.io client and makes API calls.
+    Bounded LRU cache of decoded API responses, used by Client for its
+    read calls.  Entries expire after ttl seconds, or the per-resource
+    value in ttls e.g. { "market": 3600, "app": 30 }.  Responses are
+    stored as decoded JSON and a fresh copy is handed out on every hit,
+    so callers can't modify cached state.  Thread-safe.
     """
-    def __init__(self, marketplaceid, secret, userId=1, developerId=1):
+    def __init__(self, maxsize=1024, ttl=60, ttls=None):
         """
-        Constructor
+        Constructor, maxsize=maximum number of entries, ttl=default
+        lifetime in seconds.
         """
-        self.auth = requests.auth.HTTPBasicAuth(marketplaceid, secret)
-        self.session = requests.Session()
-        self.userId = userId
-        self.developerId = developerId
-        self.base = "https://market.openchannel.io/v2"
+        if ttls == None:
+            ttls = {}
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ttls = ttls
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, resource, key):
+        """
+        Returns a copy of the cached data, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get((resource, key))
+            if entry != None and entry[0] < time.monotonic():
+                del self.entries[(resource, key)]
+                entry = None
+            if entry == None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end((resource, key))
+            self.hits += 1
+            data = entry[1]
+        return copy.deepcopy(data)
+
+    def put(self, resource, key, data):
+        """
+        Stores a copy of data.
+        """
+        ttl = self.ttls.get(resource, self.ttl)
+        data = copy.deepcopy(data)
+        with self.lock:
+            self.entries[(resource, key)] = (time.monotonic() + ttl, data)
+            self.entries.move_to_end((resource, key))
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, resource, key=None, where=None):
+        """
+        Drops an entry, or with key=None every entry for the resource for
+        which where(data) is true (or all of them, if where is None).
+        """
+        with self.lock:
+            if key != None:
+                self.entries.pop((resource, key), None)
+                return
+            for k in list(self.entries):
+                if k[0] != resource:
+                    continue
+                if where == None or where(self.entries[k][1]):
+                    del self.entries[k]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Returns hit/miss counters as a dict.
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions,
+            }
+
+class ValidatorCache:
+    """
+    Remembers the ETag/Last-Modified validators of GET responses, along
+    with the decoded body, so that Client can send conditional requests.
+    A 304 Not Modified reply is then served from the stored body.  Holds
+    at most maxsize URLs, least recently used are dropped.  Thread-safe.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    def headers(self, url):
+        """
+        Returns the conditional request headers for url, if any.
+        """
+        with self.lock:
+            self.requests += 1
+            entry = self.entries.get(url)
+            if entry == None:
+                return {}
+            self.entries.move_to_end(url)
+        hdrs = {}
+        if entry[0] != None: hdrs["If-None-Match"] = entry[0]
+        if entry[1] != None: hdrs["If-Modified-Since"] = entry[1]
+        return hdrs
+
+    def put(self, url, resp, data):
+        """
+        Stores a copy of data if resp carries validators.
+        """
+        etag = resp.headers.get("ETag")
+        modified = resp.headers.get("Last-Modified")
+        if etag == None and modified == None:
+            return
+        entry = (etag, modified, copy.deepcopy(data), len(resp.content))
+        with self.lock:
+            self.entries[url] = entry
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def revalidated(self, url):
+        """
+        Called on a 304, returns a copy of the stored body, or None if
+        it has since been dropped.
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry == None:
+                return None
+            self.not_modified += 1
+            self.bytes_saved += entry[3]
+        return copy.deepcopy(entry[2])
+
+    def stats(self):
+        """
+        Returns counters as a dict.
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries), "requests": self.requests,
+                "not_modified": self.not_modified,
+                "bytes_saved": self.bytes_saved,
+            }
+
+class RetryPolicy:
+    """
+    Decides whether and when Client retries a failed request.  Up to
+    max_attempts are made, waiting backoff * 2^n seconds (capped at
+    max_backoff, and randomised with full jitter) between them, or as long
+    as the server's Retry-After header asks.  No retry is started which
+    would end more than deadline seconds after the first attempt.
+
+    Idempotent requests (GET, DELETE and updates) are retried on a status
+    in statuses or a network error.  Other POSTs, which could be applied
+    twice, are only retried on 429 or a failure to connect, where the
+    server can't have acted on them.
+    """
+    def __init__(self, max_attempts=4, backoff=0.5, max_backoff=30,
+                 jitter=True, deadline=None,
+                 statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.statuses = statuses
+
+    def retryable(self, idempotent, status):
+        """
+        Returns True if a failed request may be retried.  status is the
+        HTTP status, "connect" if no connection could be made, or
+        "network" for any other transport failure.
+        """
+        if status == "connect":
+            return True
+        if status == "network":
+            return idempotent
+        if idempotent:
+            return status in self.statuses
+        return status == 429
+
+    def delay(self, retry, resp=None):
+        """
+        Returns the number of seconds to wait before retry number retry
+        (counting from 0).
+        """
+
+        if resp != None:
+            after = resp.headers.get("Retry-After")
+            if after != None:
+                try:
+                    return max(0.0, float(after))
+                except ValueError:
+                    try:
+                        when = email.utils.parsedate_to_datetime(after)
+                        return max(0.0, when.timestamp() - time.time())
+                    except (TypeError, ValueError):
+                        pass
+
+        delay = min(self.max_backoff, self.backoff * (2 ** retry))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+class RateLimiter:
+    """
+    Token bucket limiting requests to rate per second, shared by all the
+    threads using it.  Up to burst requests may go at once after a quiet
+    spell; the default of 1 spaces requests evenly.  Callers reserve a
+    token and then sleep until it is due, so waiting callers are released
+    at a steady rate rather than all at once.
+    """
+    def __init__(self, rate, burst=1):
+        """
+        Constructor, rate=requests per second, burst=bucket size.
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _take(self, tokens, stamp, now):
+        tokens = min(self.burst, tokens + (now - stamp) * self.rate) - 1
+        if tokens < 0:
+            return tokens, -tokens / self.rate
+        return tokens, 0.0
+
+    def _count(self, wait):
+        self.requests += 1
+        if wait > 0:
+            self.throttled += 1
+            self.waited += wait
+
+    def reserve(self):
+        """
+        Takes a token, returning the number of seconds the caller must
+        wait before sending.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens, wait = self._take(self.tokens, self.stamp, now)
+            self.stamp = now
+            self._count(wait)
+        return wait
+
+    def acquire(self):
+        """
+        Blocks until the caller may send a request.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def stats(self):
+        """
+        Returns the number of requests, how many were delayed, and the
+        total delay in seconds.
+        """
+        with self.lock:
+            return {
+                "requests": self.requests, "throttled": self.throttled,
+                "waited": self.waited,
+            }
+
+class FileRateLimiter(RateLimiter):
+    """
+    RateLimiter whose bucket is kept in a file, so that worker processes
+    using the same path share one rate.  Requires fcntl (i.e. not
+    Windows).
+    """
+    def __init__(self, path, rate, burst=1):
+        """
+        Constructor, path=bucket file, created if needed.
+        """
+        if fcntl == None:
+            raise RuntimeError("FileRateLimiter requires fcntl")
+        RateLimiter.__init__(self, rate, burst)
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def reserve(self):
+
+        with self.lock:
+
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+
+                # The bucket holds tokens and the wall-clock time they were
+                # counted at, since monotonic clocks aren't shared between
+                # processes.
+                now = time.time()
+                state = os.pread(self.fd, 64, 0).split()
+                if len(state) == 2:
+                    tokens, stamp = float(state[0]), float(state[1])
+                else:
+                    tokens, stamp = float(self.burst), now
+
+                tokens, wait = self._take(tokens, stamp, now)
+
+                state = ("%r %r" % (tokens, now)).encode().ljust(64)
+                os.pwrite(self.fd, state, 0)
+
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+            self._count(wait)
+
+        return wait
+
+    def close(self):
+        os.close(self.fd)
+
+def quoted(value):
+    """
+    value as a quoted-string for a header parameter, with its quotes and
+    backslashes escaped.  Raises ValueError if it has a line break, which
+    would end the header early.
+    """
+    if "\r" in value or "\n" in value:
+        raise ValueError("Line break in header parameter %r" % value)
+    return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+
+def disposition(name):
+    """
+    The Content-Disposition header value for a form field name holding a
+    file called name.  A filename that isn't plain ASCII is also given as
+    filename*, in percent-encoded UTF-8, after an ASCII fallback.
+    """
+    filename = os.path.basename(name)
+    fallback = re.sub(r"[^\x20-\x7e]", "_", filename)
+    value = "form-data; name=%s; filename=%s" % (
+        quoted(name), quoted(fallback)
+    )
+    if fallback != filename:
+        value += "; filename*=UTF-8''%s" % urllib.parse.quote(filename,
+                                                             safe="")
+    return value
+
+class MultipartBody:
+    """
+    A multipart/form-data request body holding one file, which is read
+    from its source a chunk at a time as it is sent rather than being
+    assembled in memory.  The source may be bytes, a str, a memoryview,
+    a binary file object, or (with path) a file on disk, which is mapped
+    into memory so chunks are sent without copying.  progress, if given,
+    is called as progress(sent, total, elapsed) after each chunk.  Raises
+    ValueError if name has a line break.
+    """
+    def __init__(self, name, data=None, path=None, progress=None,
+                 chunk_size=65536):
+
+        disp = disposition(name)
+        self.boundary = "oc-%s" % uuid.uuid4().hex
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.file = None
+        self.map = None
+
+        if path != None:
+            self.file = open(path, "rb")
+            size = os.fstat(self.file.fileno()).st_size
+            if size > 0:
+                self.map = mmap.mmap(self.file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+                self.source = memoryview(self.map)
+            else:
+                self.source = memoryview(b"")
+        elif isinstance(data, str):
+            self.source = memoryview(data.encode("utf-8"))
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            self.source = memoryview(data).cast("B")
+        elif hasattr(data, "read"):
+            self.source = data
+            start = data.tell()
+            size = data.seek(0, io.SEEK_END) - start
+            data.seek(start)
+            self.start = start
+        else:
+            raise TypeError("Can't upload %s" % type(data).__name__)
+
+        if isinstance(self.source, memoryview):
+            size = len(self.source)
+
+        head = (
+            '--%s\r\nContent-Disposition: %s\r\n'
+            'Content-Type: application/octet-stream\r\n\r\n' % (
+                self.boundary, disp
+            )
+        ).encode("utf-8")
+        tail = ("\r\n--%s--\r\n" % self.boundary).encode("utf-8")
+
+        self.parts = [memoryview(head), self.source, memoryview(tail)]
+        self.length = len(head) + size + len(tail)
+        self.content_type = "multipart/form-data; boundary=%s" % self.boundary
+        self.seek(0)
+
+    def __len__(self):
+        return self.length
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        Rewinds the body, so it can be sent again on a retry.
+        """
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can only rewind")
+        self.part = 0
+        self.offset = 0
+        self.sent = 0
+        self.started = None
+        if not isinstance(self.source, memoryview):
+            self.source.seek(self.start)
+        return 0
+
+    def tell(self):
+        return self.sent
+
+    def read(self, size=-1):
+        """
+        Returns the next chunk of at most size bytes, as a memoryview
+        where possible.
+        """
+
+        if size == None or size < 0:
+            size = self.chunk_size
+
+        if self.started == None:
+            self.started = time.monotonic()
+
+        while self.part < len(self.parts):
+
+            part = self.parts[self.part]
+            if isinstance(part, memoryview):
+                chunk = part[self.offset:self.offset + size]
+                self.offset += len(chunk)
+            else:
+                chunk = part.read(size)
+
+            if len(chunk) == 0:
+                self.part += 1
+                self.offset = 0
+                continue
+
+            self.sent += len(chunk)
+            if self.progress != None:
+                self.progress(self.sent, self.length,
+                              time.monotonic() - self.started)
+            return chunk
+
+        return b""
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    async def __aiter__(self):
+        # aiohttp iterates once per attempt, so start again each time.
+        self.seek(0)
+        while True:
+            chunk = self.read(self.chunk_size)
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    def close(self):
+        self.parts = []
+        if self.source != None and isinstance(self.source, memoryview):
+            self.source.release()
+        if self.map != None:
+            self.map.close()
+        if self.file != None:
+            self.file.close()
+
+def file_digest(path):
+    """
+    Returns the SHA-256 hex digest of the file at path, and its size.
+    """
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1048576)
+            if len(chunk) == 0:
+                break
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+class UploadIndex:
+    """
+    Persistent map from the SHA-256 of file content to the File it was
+    uploaded as, stored as JSON at path.  Used by Client.upload_files to
+    skip content which has already been uploaded.  Thread-safe.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get(self, digest):
+        with self.lock:
+            data = self.entries.get(digest)
+        if data == None:
+            return None
+        return File().parse(data)
+
+    def put(self, digest, file):
+        data = file.fields()
+        with self.lock:
+            self.entries[digest] = data
+
+    def save(self):
+        """
+        Writes the index out, replacing the old file atomically.
+        """
+        with self.lock:
+            tmp = "%s.tmp" % self.path
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+
+class UploadReport:
+    """
+    Result of Client.upload_files.  files maps each input path to its
+    File, errors maps failed paths to the exception.  uploaded and skipped
+    count distinct contents sent and found already uploaded.
+    """
+    def __init__(self):
+        self.files = {}
+        self.errors = {}
+        self.uploaded = 0
+        self.skipped = 0
+        self.bytes_uploaded = 0
+        self.bytes_skipped = 0
+        self.seconds = 0.0
+
+    def rate(self):
+        """
+        Returns upload throughput in bytes/second.
+        """
+        if self.seconds <= 0:
+            return 0.0
+        return self.bytes_uploaded / self.seconds
+
+    def add(self, group, size, res):
+        """
+        Records res, the BulkResult of uploading the content of size bytes
+        at every path in group, whose value is (file, sent).
+        """
+        if not res.ok():
+            for path in group:
+                self.errors[path] = res.error
+            return
+        file, sent = res.value
+        if sent:
+            self.uploaded += 1
+            self.bytes_uploaded += size
+            self.bytes_skipped += size * (len(group) - 1)
+        else:
+            self.skipped += 1
+            self.bytes_skipped += size * len(group)
+        for path in group:
+            self.files[path] = file
+
+    def dedup_ratio(self):
+        """
+        Returns the fraction of input bytes which didn't need uploading.
+        """
+        total = self.bytes_uploaded + self.bytes_skipped
+        if total == 0:
+            return 0.0
+        return self.bytes_skipped / total
+
+    def __str__(self):
+        return (
+            "%d files, %d uploaded, %d skipped, %d errors, %.0f bytes/s, "
+            "%.1f%% deduplicated" % (
+                len(self.files) + len(self.errors), self.uploaded,
+                self.skipped, len(self.errors), self.rate(),
+                100 * self.dedup_ratio()
+            )
+        )
+
+class Flight:
+    """
+    A GET in progress, which callers asking for the same URL wait on
+    rather than sending their own request.  AsyncClient waits on future
+    rather than done, and counts the callers still waiting in callers.
+    """
+    def __init__(self, future=None):
+        self.done = threading.Event()
+        self.future = future
+        self.waiters = 0
+        self.callers = 0
+        self.data = None
+        self.error = None
+
+class BulkResult:
+    """
+    Outcome of one item in a bulk call.  key identifies the item, value
+    is the returned object on success, error the exception on failure.
+    seconds is how long the call took.
+    """
+    def __init__(self, key, value=None, error=None):
+        self.key = key
+        self.value = value
+        self.error = error
+        self.seconds = 0.0
+    def ok(self):
+        return self.error == None
+    def call(self, fn, *args):
+        """
+        Sets value to fn(*args), or fn(key) if no args are given, or error
+        to the exception it raises.
+        """
+        start = time.monotonic()
+        try:
+            if len(args) == 0:
+                args = (self.key,)
+            self.value = fn(*args)
+        except Exception as e:
+            self.error = e
+        self.seconds = time.monotonic() - start
+        return self
+    def __str__(self):
+        if self.error != None:
+            return "%s: error %s" % (self.key, self.error)
+        return "%s: %s" % (self.key, self.value)
+
+class BatchReport:
+    """
+    Results of a batch mutation such as Client.update_users.  Iterating
+    over it runs the batch, yielding a BulkResult per input item in input
+    order.  Only totals are kept, so a batch of any size runs in bounded
+    memory; str() gives a summary.
+    """
+    def __init__(self, results):
+        self.results = results
+        self.count = 0
+        self.failed = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.started = None
+        self.elapsed = 0.0
+
+    def _add(self, res):
+        self.count += 1
+        if not res.ok():
+            self.failed += 1
+        self.seconds += res.seconds
+        self.max_seconds = max(self.max_seconds, res.seconds)
+        self.elapsed = time.monotonic() - self.started
+
+    def __iter__(self):
+        self.started = time.monotonic()
+        for res in self.results:
+            self._add(res)
+            yield res
+
+    def run(self):
+        """
+        Runs the batch, discarding the per-item results, returns self.
+        """
+        for res in self:
+            pass
+        return self
+
+    def __str__(self):
+        mean = self.seconds / self.count if self.count > 0 else 0.0
+        rate = self.count / self.elapsed if self.elapsed > 0 else 0.0
+        return (
+            "%d items, %d failed, %.1f items/s, mean %.3fs, max %.3fs" % (
+                self.count, self.failed, rate, mean, self.max_seconds
+            )
+        )
+
+class AsyncBatchReport(BatchReport):
+    """
+    BatchReport of an AsyncClient batch, which runs as it is iterated over
+    with async for, or by awaiting run().
+    """
+    async def __aiter__(self):
+        self.started = time.monotonic()
+        async for res in self.results:
+            self._add(res)
+            yield res
+
+    async def run(self):
+        async for res in self:
+            pass
+        return self
+
+class StatsSeries:
+    """
+    Stats time series held as columns: for each (appId, field), an array of
+    timestamps (ms) and an array of values.  The arrays are NumPy arrays if
+    numpy is installed, otherwise array.array.  appId is None for a series
+    covering all apps.
+    """
+
+    intervals = {
+        "hour": 3600000, "day": 86400000, "week": 7 * 86400000,
+    }
+
+    def __init__(self, period="day"):
+        self.period = period
+        self.series = {}
+
+    @staticmethod
+    def _arrays(timestamps, values):
+        if numpy != None:
+            return (
+                numpy.asarray(timestamps, dtype=numpy.int64),
+                numpy.asarray(values, dtype=numpy.float64),
+            )
+        return array.array("q", timestamps), array.array("d", values)
+
+    def add(self, app, field, rows):
+        """
+        Adds a series from the API's [[timestamp, value], ...] form.
+        """
+        self.series[(app, field)] = self._arrays(
+            [int(r[0]) for r in rows], [r[1] for r in rows]
+        )
+
+    def apps(self):
+        return list(dict.fromkeys(app for app, field in self.series))
+
+    def fields(self):
+        return list(dict.fromkeys(field for app, field in self.series))
+
+    def get(self, field, app=None):
+        """
+        Returns the (timestamps, values) arrays of a series.
+        """
+        return self.series[(app, field)]
+
+    def sum(self, field):
+        """
+        Returns a dict from appId to the total of field over the range.
+        """
+        return {
+            app: float(values.sum()) if numpy != None else sum(values)
+            for (app, f), (ts, values) in self.series.items() if f == field
+        }
+
+    def top(self, field, n=10):
+        """
+        Returns the n apps with the highest total of field, as
+        (appId, total) pairs, highest first.
+        """
+        totals = self.sum(field)
+        if numpy != None and totals:
+            apps = list(totals)
+            values = numpy.fromiter(totals.values(), dtype=numpy.float64)
+            order = numpy.argsort(-values, kind="stable")[:n]
+            return [(apps[i], float(values[i])) for i in order]
+        return sorted(totals.items(), key=lambda v: -v[1])[:n]
+
+    def resample(self, field, interval, apps=None):
+        """
+        Sums field into buckets of interval, in ms or "hour", "day" or
+        "week", across apps (all of them by default).  Returns
+        (timestamps, values) arrays, the timestamps being bucket starts.
+        """
+
+        interval = self.intervals.get(interval, interval)
+
+        parts = [
+            self.series[(app, f)] for app, f in self.series
+            if f == field and (apps == None or app in apps)
+        ]
+
+        if numpy != None:
+            if not parts:
+                return self._arrays([], [])
+            ts = numpy.concatenate([p[0] for p in parts])
+            values = numpy.concatenate([p[1] for p in parts])
+            buckets, inverse = numpy.unique(
+                ts // interval * interval, return_inverse=True
+            )
+            return buckets, numpy.bincount(
+                inverse.ravel(), weights=values, minlength=len(buckets)
+            )
+
+        totals = {}
+        for ts, values in parts:
+            for t, v in zip(ts, values):
+                bucket = t // interval * interval
+                totals[bucket] = totals.get(bucket, 0.0) + v
+        buckets = sorted(totals)
+        return self._arrays(buckets, [totals[b] for b in buckets])
+
+    def columns(self, field):
+        """
+        Returns the series of field in long form, a dict of equal-length
+        "appId", "timestamp" and "value" columns, e.g. for
+        pandas.DataFrame().
+        """
+
+        parts = [
+            (app, ts, values) for (app, f), (ts, values) in self.series.items()
+            if f == field
+        ]
+
+        apps = [app for app, ts, values in parts for i in range(len(ts))]
+        if numpy != None and parts:
+            return {
+                "appId": apps,
+                "timestamp": numpy.concatenate([p[1] for p in parts]),
+                "value": numpy.concatenate([p[2] for p in parts]),
+            }
+
+        ts, values = self._arrays(
+            [t for p in parts for t in p[1]], [v for p in parts for v in p[2]]
+        )
+        return { "appId": apps, "timestamp": ts, "value": values }
+
+class RangePlanner:
+    """
+    Splits a long stats window into chunks of whole periods ("hour", "day"
+    or "month"), aligned to the epoch (or calendar months, in UTC) so that
+    the same historical chunks come up whatever the window.
+    """
+
+    periods = { "hour": 3600000, "day": 86400000 }
+
+    # Default number of periods per chunk.
+    chunks = { "hour": 168, "day": 31, "month": 12 }
+
+    def __init__(self, period="day", chunk=None):
+        if period not in self.chunks:
+            raise ValueError("Unknown period %s" % period)
+        if chunk == None:
+            chunk = self.chunks[period]
+        self.period = period
+        self.chunk = chunk
+
+    @staticmethod
+    def _month(ms):
+        d = datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc)
+        return d.year * 12 + d.month - 1
+
+    @staticmethod
+    def _month_start(month):
+        d = datetime.datetime(
+            month // 12, month % 12 + 1, 1, tzinfo=datetime.timezone.utc
+        )
+        return int(d.timestamp()) * 1000
+
+    def plan(self, start, end):
+        """
+        Returns the (start, end) pairs, in ms, covering start to end in
+        order.  The first and last are clipped to the window.
+        """
+
+        if start >= end:
+            return []
+
+        bounds = []
+        if self.period == "month":
+            month = self._month(start) // self.chunk * self.chunk
+            while True:
+                bounds.append(self._month_start(month))
+                if bounds[-1] >= end:
+                    break
+                month += self.chunk
+        else:
+            size = self.periods[self.period] * self.chunk
+            t = start // size * size
+            while True:
+                bounds.append(t)
+                if t >= end:
+                    break
+                t += size
+
+        return [
+            (max(a, start), min(b, end)) for a, b in zip(bounds, bounds[1:])
+        ]
+
+class StatsCache:
+    """
+    Directory of stats chunks fetched by get_stats_series_range and
+    get_stats_total_range.  Only chunks ending at least settle seconds ago
+    are kept, on the basis that history older than that no longer changes.
+    """
+
+    def __init__(self, path, settle=86400):
+        self.path = path
+        self.settle = settle
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, *parts):
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def final(self, end):
+        """
+        True if a chunk ending at end (ms) can be cached.
+        """
+        return end <= (time.time() - self.settle) * 1000
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.path, key + ".json"), "rb") as f:
+                value = json.loads(f.read())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = os.path.join(self.path, key + ".json")
+        tmp = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+        with open(tmp, "w") as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+
+    def stats(self):
+        return { "hits": self.hits, "misses": self.misses }
+
+def merge_series(parts):
+    """
+    Joins consecutive chunks of a [[timestamp, value], ...] series.  A
+    bucket repeated where two chunks meet is only partly counted by the
+    earlier chunk, which ends part-way through it, so the later chunk's
+    row is kept.
+    """
+    rows = []
+    for part in parts:
+        if len(part) > 0:
+            while rows and rows[-1][0] >= part[0][0]:
+                rows.pop()
+        rows.extend(part)
+    return rows
+
+def merge_totals(a, b):
+    """
+    Adds two stats/total responses together, member by member.
+    """
+    if isinstance(a, dict) and isinstance(b, dict):
+        merged = dict(a)
+        for k, v in b.items():
+            merged[k] = merge_totals(merged[k], v) if k in merged else v
+        return merged
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a + b
+    return b
+
+class StatsAggregator:
+    """
+    Keeps the last retain seconds of stats series in memory, per app and
+    field, so that totals over sliding windows are answered locally.
+    refresh() only fetches from the newest bucket held onwards, that
+    bucket being fetched again as it may have been partial.
+
+    Windows are counted in whole buckets: a bucket is included if it starts
+    within the window.
+    """
+
+    def __init__(self, client, apps=None, fields=("views", "downloads"),
+                 period="hour", retain=7 * 86400, query=None,
+                 max_workers=None):
+        """
+        Constructor, apps is a list of app ids to follow, or None for
+        totals across all apps.
+        """
+        if apps == None:
+            apps = [None]
+        if query == None:
+            query = {}
+        self.client = client
+        self.apps = list(apps)
+        self.fields = list(fields)
+        self.period = period
+        self.retain = retain
+        self.query = query
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.series = {
+            (app, field): ([], []) for app in self.apps for field in self.fields
+        }
+        self.refreshed = None
+
+    def _fetch(self, key, start, end):
+        app, field = key
+        query = dict(self.query)
+        if app != None:
+            query["appId"] = app
+        return self.client.get_stats_series(
+            start, end, query, field, self.period
+        )
+
+    def refresh(self, now=None):
+        """
+        Fetches new buckets for every series concurrently, and drops those
+        older than retain.  Returns the number of buckets fetched.
+        """
+
+        if now == None:
+            now = time.time()
+        end = int(now * 1000)
+        oldest = int((now - self.retain) * 1000)
+
+        with self.lock:
+            starts = {
+                key: ts[-1] if ts else oldest
+                for key, (ts, values) in self.series.items()
+            }
+
+        results = self.client.bulk(
+            lambda key: self._fetch(key, starts[key], end),
+            list(self.series), self.max_workers
+        )
+
+        count = 0
+        with self.lock:
+            for res in results:
+                if res.error != None:
+                    raise res.error
+                ts, values = self.series[res.key]
+                keep = bisect.bisect_left(ts, starts[res.key])
+                del ts[keep:], values[keep:]
+                for row in res.value:
+                    if row[0] >= oldest and (not ts or row[0] > ts[-1]):
+                        ts.append(row[0])
+                        values.append(row[1])
+                        count += 1
+                drop = bisect.bisect_left(ts, oldest)
+                del ts[:drop], values[:drop]
+            self.refreshed = now
+
+        return count
+
+    def total(self, field, window, app=None, now=None):
+        """
+        Returns the total of field over the last window seconds, for one
+        app, or across all of them if app is None.
+        """
+
+        if now == None:
+            now = time.time()
+        since = int((now - window) * 1000)
+
+        apps = self.apps if app == None else [app]
+        total = 0
+        with self.lock:
+            for a in apps:
+                ts, values = self.series[(a, field)]
+                total += sum(values[bisect.bisect_left(ts, since):])
+        return total
+
+    def totals(self, window, app=None, now=None):
+        """
+        Returns a dict of field totals over the last window seconds.
+        """
+        return {
+            field: self.total(field, window, app, now) for field in self.fields
+        }
+
+    def top(self, field, window, n=10, now=None):
+        """
+        Returns the n apps with the highest totals of field over the last
+        window seconds, as (appId, total) pairs.
+        """
+        totals = [
+            (app, self.total(field, window, app, now)) for app in self.apps
+        ]
+        return sorted(totals, key=lambda v: -v[1])[:n]
+
+class StreamStarved(Exception):
+    """
+    Raised within a pushed ListStream when it needs another chunk.
+    """
+
+class ListStream:
+    """
+    Incremental parser for a list response, e.g. { "count": 2, "list":
+    [ {...}, {...} ] }, read from an iterable of byte chunks.  Iterating
+    yields the elements of the key array one at a time as they arrive, so
+    only the current chunk and element are held.  Other top-level members
+    are collected in meta.
+
+    With chunks=None the data is pushed instead, for AsyncClient: each
+    chunk is passed to feed(), after which ready() yields the elements it
+    completed.
+    """
+
+    space = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, chunks=None, key="list"):
+        self.chunks = iter(chunks) if chunks != None else None
+        self.key = key
+        self.meta = {}
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        # Where the parse has got to, so that it can stop for more data
+        # between any two steps and carry on where it left off.
+        self.state = "start"
+        self.name = None
+
+    def _append(self, chunk, final=False):
+        if self.pos > len(self.buf) // 2:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        self.buf += self.utf8.decode(chunk, final)
+
+    def _more(self):
+        if self.eof:
+            raise ValueError("Truncated JSON response")
+        if self.chunks == None:
+            raise StreamStarved()
+        for chunk in self.chunks:
+            if chunk:
+                self._append(chunk)
+                return
+        self._append(b"", final=True)
+        self.eof = True
+
+    def _skip(self):
+        while True:
+            self.pos = self.space.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self._more()
+
+    def _expect(self, chars):
+        c = self._skip()
+        if c not in chars:
+            raise ValueError("Unexpected %r in JSON response" % c)
+        self.pos += 1
+        return c
+
+    def _value(self):
+        self._skip()
+        while True:
+            # A number may be cut short by the end of the buffer, even
+            # mid-way, e.g. "3." of "3.25", so only take a value once
+            # something follows which can't continue it.
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                if self.eof or (end < len(self.buf) and
+                                self.buf[end] not in "0123456789.eE+-"):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._more()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+
+        # Each step either completes or, lacking data, leaves the state
+        # as it was.
+        while True:
+            state = self.state
+            if state == "element":
+                value = self._value()
+                self.state = "after"
+                return value
+            elif state == "after":
+                if self._expect(",]") == ",":
+                    self.state = "element"
+                else:
+                    self.state = "next"
+            elif state == "start":
+                self._expect("{")
+                self.state = "first"
+            elif state == "first":
+                if self._skip() == "}":
+                    self.pos += 1
+                    self.state = "done"
+                else:
+                    self.state = "name"
+            elif state == "name":
+                self.name = self._value()
+                self.state = "colon"
+            elif state == "colon":
+                self._expect(":")
+                self.state = "list" if self.name == self.key else "meta"
+            elif state == "meta":
+                self.meta[self.name] = self._value()
+                self.state = "next"
+            elif state == "list":
+                self._expect("[")
+                self.state = "empty"
+            elif state == "empty":
+                if self._skip() == "]":
+                    self.pos += 1
+                    self.state = "next"
+                else:
+                    self.state = "element"
+            elif state == "next":
+                if self._expect(",}") == ",":
+                    self.state = "name"
+                else:
+                    self.state = "done"
+            else:
+                raise StopIteration
+
+    def feed(self, chunk, final=False):
+        """
+        Adds a chunk of pushed data, final=True marks the end of it.
+        """
+        self._append(chunk, final)
+        self.eof = final
+
+    def ready(self):
+        """
+        Yields the elements which the data fed so far completes.
+        """
+        while True:
+            try:
+                value = next(self)
+            except (StopIteration, StreamStarved):
+                return
+            yield value
+
+class ExportReport:
+    """
+    Result of Exporter.export.  files lists the partition files written,
+    errors maps failed partitions to the exception.  skipped counts
+    partitions already exported by an earlier run.
+    """
+    def __init__(self):
+        self.files = []
+        self.errors = {}
+        self.rows = 0
+        self.partitions = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def rate(self):
+        """
+        Returns export throughput in rows/second.
+        """
+        if self.seconds <= 0:
+            return 0.0
+        return self.rows / self.seconds
+
+    def __str__(self):
+        return (
+            "%d rows, %d partitions, %d skipped, %d errors, %.0f rows/s" % (
+                self.rows, self.partitions, self.skipped, len(self.errors),
+                self.rate()
+            )
+        )
+
+class Exporter:
+    """
+    Exports transactions or ownership records to files in path, one per
+    date partition (see RangePlanner), as NDJSON, CSV, or Parquet if
+    pyarrow is installed.  Partitions are fetched with the streaming list
+    calls, limit rows a page, and written concurrently, each holding at
+    most batch rows.
+
+    Finished partitions are recorded in path/checkpoint.json, with their
+    row count and last date, so a later export() of an overlapping range
+    only fetches the partitions not yet done.  Partitions ending in the
+    future are written but not recorded.
+    """
+
+    formats = { "ndjson": "ndjson", "csv": "csv", "parquet": "parquet" }
+
+    streams = {
+        "transactions": "stream_transactions",
+        "ownership": "stream_ownership",
+    }
+
+    # Default CSV and Parquet columns, nested members are written as JSON.
+    columns = {
+        "transactions": [
+            "transactionId", "ownershipId", "appId", "userId", "developerId",
+            "date", "amount", "feeAmount", "marketplaceAmount", "currency",
+            "type", "customData",
+        ],
+        "ownership": [
+            "ownershipId", "appId", "userId", "developerId", "modelId",
+            "date", "productKey", "ownershipType", "ownershipStatus",
+            "customData",
+        ],
+    }
+
+    def __init__(self, client, path, kind="transactions", format="ndjson",
+                 period="day", columns=None, query=None, max_workers=None,
+                 batch=10000, limit=1000):
+        if kind not in self.streams:
+            raise ValueError("Can't export %s" % kind)
+        if format not in self.formats:
+            raise ValueError("Unknown format %s" % format)
+        if format == "parquet" and pyarrow == None:
+            raise RuntimeError("Parquet export requires the pyarrow package")
+        if columns == None:
+            columns = self.columns[kind]
+        if query == None:
+            query = {}
+        if max_workers == None:
+            max_workers = client.max_workers
+        self.client = client
+        self.path = path
+        self.kind = kind
+        self.format = format
+        self.period = period
+        self.columns = columns
+        self.query = query
+        self.max_workers = max_workers
+        self.batch = batch
+        self.limit = limit
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.checkpoint_path = os.path.join(path, "checkpoint.json")
+        try:
+            with open(self.checkpoint_path) as f:
+                self.checkpoint = json.load(f)
+        except FileNotFoundError:
+            self.checkpoint = {}
+
+    def _name(self, start):
+        d = datetime.datetime.fromtimestamp(start / 1000, datetime.timezone.utc)
+        if self.period == "month":
+            date = d.strftime("%Y-%m")
+        elif self.period == "hour":
+            date = d.strftime("%Y-%m-%dT%H")
+        else:
+            date = d.strftime("%Y-%m-%d")
+        return "%s-%s" % (self.kind, date)
+
+    def done(self, start, end):
+        """
+        True if the partition start..end was exported by an earlier run.
+        """
+        with self.lock:
+            entry = self.checkpoint.get(self._name(start))
+        return (
+            entry != None and entry["start"] <= start and entry["end"] >= end
+        )
+
+    def _record(self, name, entry):
+        with self.lock:
+            self.checkpoint[name] = entry
+            tmp = "%s.tmp" % self.checkpoint_path
+            with open(tmp, "w") as f:
+                json.dump(self.checkpoint, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.checkpoint_path)
+
+    def _row(self, obj):
+        data = plain(obj)
+        row = []
+        for column in self.columns:
+            value = data
+            for name in column.split("."):
+                value = value.get(name) if isinstance(value, dict) else None
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            row.append(value)
+        return row
+
+    def _write_ndjson(self, f, objs):
+        codec = self.client.codec
+        for obj in objs:
+            f.write(codec.encode(obj))
+            f.write(b"\n")
+            yield obj
+
+    def _write_csv(self, f, objs):
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(self.columns)
+        for obj in objs:
+            writer.writerow(self._row(obj))
+            yield obj
+        text.flush()
+        text.detach()
+
+    def _write_parquet(self, f, objs):
+
+        writer = None
+        rows = []
+
+        def flush():
+            nonlocal writer
+            table = pyarrow.Table.from_pylist(
+                [dict(zip(self.columns, r)) for r in rows],
+                schema=writer.schema if writer != None else None
+            )
+            if writer == None:
+                # Columns with no values yet can't be typed, make them text.
+                schema = pyarrow.schema([
+                    field.with_type(pyarrow.string())
+                    if pyarrow.types.is_null(field.type) else field
+                    for field in table.schema
+                ])
+                table = table.cast(schema)
+                writer = pyarrow.parquet.ParquetWriter(f, schema)
+            writer.write_table(table)
+            del rows[:]
+
+        for obj in objs:
+            rows.append(self._row(obj))
+            if len(rows) >= self.batch:
+                flush()
+            yield obj
+
+        if rows or writer == None:
+            flush()
+        writer.close()
+
+    def _partition(self, start, end):
+        """
+        Fetches and writes every page of one partition, returning (path,
+        rows).  It is only recorded as done once the last page is written.
+        """
+
+        name = self._name(start)
+        path = os.path.join(
+            self.path, "%s.%s" % (name, self.formats[self.format])
+        )
+        tmp = "%s.tmp" % path
+
+        query = dict(self.query)
+        query["date"] = { "$gte": start, "$lt": end }
+        objs = getattr(self.client, self.streams[self.kind])(query, self.limit)
+
+        write = getattr(self, "_write_" + self.format)
+        rows = 0
+        last = None
+        try:
+            with open(tmp, "wb") as f:
+                for obj in write(f, objs):
+                    rows += 1
+                    date = getattr(obj, "date", None)
+                    if date != None and (last == None or date > last):
+                        last = date
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        if end <= time.time() * 1000:
+            self._record(name, {
+                "start": start, "end": end, "rows": rows, "last": last,
+                "file": os.path.basename(path),
+            })
+
+        return path, rows
+
+    def export(self, start, end):
+        """
+        Exports the records dated from start to end (ms), skipping
+        partitions already done.  Returns an ExportReport.
+        """
+
+        report = ExportReport()
+        began = time.monotonic()
+
+        plan = RangePlanner(self.period, 1).plan(start, end)
+        pending = [c for c in plan if not self.done(*c)]
+        report.skipped = len(plan) - len(pending)
+
+        if pending:
+            workers = min(self.max_workers, len(pending))
+            with concurrent.futures.ThreadPoolExecutor(workers) as ex:
+                futures = {
+                    ex.submit(self._partition, a, b): self._name(a)
+                    for a, b in pending
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        path, rows = future.result()
+                    except Exception as e:
+                        report.errors[futures[future]] = e
+                        continue
+                    report.files.append(path)
+                    report.rows += rows
+                    report.partitions += 1
+
+        report.files.sort()
+        report.seconds = time.monotonic() - began
+        return report
+
+class Metrics:
+    """
+    Per-endpoint request metrics, for Client(metrics=...).  Each request
+    is counted against its method and templated path, e.g.
+    "GET /apps/{id}/versions/{version}", with a latency histogram, bytes
+    sent and received, status codes and retries.
+
+    on_start and on_end, if given, are called with an event dict for each
+    request, the same dict both times: method, endpoint, url and start
+    (time.monotonic()) on start, then status (None if no response came
+    back), seconds, sent, received, error and failed.  They're called on
+    the thread making the request, so should be quick.
+
+    A request counts as an error if it raised, or its status is 400 or
+    over and not one the caller said it accepts; a 304 from revalidation
+    is a success.
+    """
+
+    # Histogram bucket upper bounds in seconds, the last catching the rest.
+    buckets = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+        float("inf"),
+    )
+
+    # Path segments which are part of the API rather than ids.
+    words = frozenset([
+        "apps", "versions", "bySafeName", "live", "publish", "status",
+        "custom-gateway", "payment", "refund", "developers", "users",
+        "groups", "files", "url", "markets", "this", "ownership", "install",
+        "uninstall", "permission", "reviews", "stats", "series", "total",
+        "transactions",
+    ])
+
+    # Placeholder for an id, by the segment before it.
+    names = {
+        "versions": "{version}", "bySafeName": "{safeName}",
+        "groups": "{groupId}", "series": "{period}", "{period}": "{field}",
+    }
+
+    def __init__(self, on_start=None, on_end=None):
+        self.on_start = on_start
+        self.on_end = on_end
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def template(self, path):
+        """
+        Returns path with its ids replaced by placeholders.
+        """
+        out = []
+        for segment in path.split("/"):
+            if segment and segment not in self.words:
+                segment = self.names.get(out[-1] if out else None, "{id}")
+            out.append(segment)
+        return "/".join(out)
+
+    def endpoint(self, method, url, base):
+        path = url[len(base):] if url.startswith(base) else url
+        return "%s %s" % (method, self.template(path.split("?", 1)[0]))
+
+    def _entry(self, endpoint):
+        entry = self.endpoints.get(endpoint)
+        if entry == None:
+            entry = {
+                "requests": 0, "errors": 0, "retries": 0, "seconds": 0.0,
+                "max_seconds": 0.0, "sent": 0, "received": 0,
+                "statuses": {}, "histogram": [0] * len(self.buckets),
+            }
+            self.endpoints[endpoint] = entry
+        return entry
+
+    def start(self, method, url, base, data=None):
+        """
+        Called as a request is sent, returns the event for end().
+        """
+        sent = 0
+        if isinstance(data, (bytes, bytearray, str, MultipartBody)):
+            sent = len(data)
+        event = {
+            "method": method, "endpoint": self.endpoint(method, url, base),
+            "url": url, "sent": sent, "start": time.monotonic(),
+        }
+        if self.on_start != None:
+            self.on_start(event)
+        return event
+
+    def end(self, event, status=None, received=0, error=None, allow=()):
+        """
+        Called when a request completes or fails.  allow lists the
+        statuses the caller accepts.
+        """
+
+        seconds = time.monotonic() - event["start"]
+        failed = (
+            status == None or (status >= 400 and status not in allow)
+        )
+        event.update(
+            status=status, seconds=seconds, received=received, error=error,
+            failed=failed
+        )
+
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            entry = self._entry(event["endpoint"])
+            entry["requests"] += 1
+            if failed:
+                entry["errors"] += 1
+            entry["seconds"] += seconds
+            if seconds > entry["max_seconds"]:
+                entry["max_seconds"] = seconds
+            entry["sent"] += event["sent"]
+            entry["received"] += received
+            key = status if status != None else "error"
+            entry["statuses"][key] = entry["statuses"].get(key, 0) + 1
+            entry["histogram"][bucket] += 1
+
+        if self.on_end != None:
+            self.on_end(event)
+
+    def retry(self, method, url, base):
+        endpoint = self.endpoint(method, url, base)
+        with self.lock:
+            self._entry(endpoint)["retries"] += 1
+
+    def quantile(self, histogram, q):
+        """
+        Returns the upper bound of the bucket holding quantile q of a
+        histogram.
+        """
+        total = sum(histogram)
+        if total == 0:
+            return 0.0
+        seen = 0
+        for bound, count in zip(self.buckets, histogram):
+            seen += count
+            if seen >= q * total:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        """
+        Returns a copy of the counters by endpoint, with the mean and
+        estimated p50/p99 latency of each.
+        """
+        with self.lock:
+            endpoints = copy.deepcopy(self.endpoints)
+        for entry in endpoints.values():
+            hist = entry["histogram"]
+            entry["mean_seconds"] = entry["seconds"] / max(entry["requests"], 1)
+            # Past the last bound, the slowest request is the best guess.
+            for q in (50, 99):
+                value = self.quantile(hist, q / 100)
+                if value == float("inf"):
+                    value = entry["max_seconds"]
+                entry["p%d_seconds" % q] = value
+            entry["buckets"] = list(self.buckets[:-1])
+        return endpoints
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+class SessionTransport:
+    """
+    Sends requests on a requests Session; the transport Client uses
+    unless told otherwise.  A transport is any object with a request()
+    method taking the arguments of Session.request, less auth and
+    timeout, and returning a response with status_code, headers, content,
+    text, iter_content() and close().
+    """
+
+    def __init__(self, session, auth=None, timeout=None):
+        self.session = session
+        self.auth = auth
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, auth=self.auth,
+                                    timeout=self.timeout, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+class ReplayResponse:
+    """
+    Response served by ReplayTransport, with the parts of
+    requests.Response that Client uses.
+    """
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.headers["Content-Length"] = str(len(content))
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+class RecordingTransport:
+    """
+    Passes requests on to another transport, recording each response to a
+    cassette at path for ReplayTransport: gzipped JSON lines, one per
+    response, holding the method, URL, status, the headers Client uses and
+    the body.  Call close() to finish the file.
+    """
+
+    headers = ("Content-Type", "ETag", "Last-Modified", "Retry-After")
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.count = 0
+
+    def request(self, method, url, **kwargs):
+
+        resp = self.inner.request(method, url, **kwargs)
+
+        # Reading the body here means streamed responses are buffered
+        # while recording.
+        content = resp.content
+        try:
+            body, encoding = content.decode("utf-8"), None
+        except UnicodeDecodeError:
+            body = base64.b64encode(content).decode("ascii")
+            encoding = "base64"
+
+        entry = {
+            "method": method, "url": url, "status": resp.status_code,
+            "headers": {
+                k: resp.headers[k] for k in self.headers if k in resp.headers
+            },
+            "body": body,
+        }
+        if encoding != None:
+            entry["encoding"] = encoding
+
+        line = json.dumps(entry, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line)
+            self.file.write("\n")
+            self.count += 1
+
+        return resp
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class ReplayTransport:
+    """
+    Serves the responses recorded in a cassette by RecordingTransport
+    without touching the network.  Responses for the same method and URL
+    are served in the order recorded, starting over once all have been
+    used, so a short recording can drive a long load test.  A request with
+    no recording gets a 404.
+
+    latency, in seconds, is slept before each response to simulate the
+    network.
+    """
+
+    def __init__(self, path, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.next = {}
+        self.served = 0
+        self.missed = 0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if entry.get("encoding") == "base64":
+                    content = base64.b64decode(entry["body"])
+                else:
+                    content = entry["body"].encode("utf-8")
+                key = (entry["method"], entry["url"])
+                self.responses.setdefault(key, []).append(
+                    ReplayResponse(entry["status"], entry["headers"], content)
+                )
+
+    def request(self, method, url, **kwargs):
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        key = (method, url)
+        responses = self.responses.get(key)
+
+        with self.lock:
+            if responses == None:
+                self.missed += 1
+                return ReplayResponse(
+                    404, {}, b"No recorded response for " +
+                    ("%s %s" % key).encode("utf-8")
+                )
+            self.served += 1
+            i = self.next.get(key, 0)
+            self.next[key] = (i + 1) % len(responses)
+
+        return responses[i]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "recorded": sum(len(v) for v in self.responses.values()),
+                "served": self.served, "missed": self.missed,
+            }
+
+    def close(self):
+        pass
+
+class Client:
+    """
+    Encapsulates an openchannel.io client and makes API calls.
+    """
+    def __init__(self, marketplaceid, secret, userId=1, developerId=1,
+                 max_workers=8, cache=None, validators=None,
+                 pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, timeout=None, retry=None, limiter=None,
+                 write_limiter=None, coalesce=True, codec=None,
+                 stats_cache=None, metrics=None, transport=None):
+        """
+        Constructor, max_workers bounds the concurrency of bulk calls.
+        cache is an optional Cache for get_app, get_user etc.
+        validators is an optional ValidatorCache, which makes GETs
+        conditional on the previous response's ETag/Last-Modified.
+
+        Every call shares one connection pool.  pool_connections is the
+        number of hosts to keep pools for, pool_maxsize the number of
+        connections kept per host, and with pool_block=True callers wait
+        for a free connection rather than opening an extra one.
+        keep_alive=False closes connections after each request.  timeout
+        is in seconds, either a number or a (connect, read) pair, None
+        waits forever.  retry is an optional RetryPolicy.
+
+        limiter is an optional RateLimiter which every request must pass
+        before it is sent.  If write_limiter is given, it is used for
+        POST and DELETE requests instead, giving writes their own quota.
+
+        With coalesce=True, threads making the same GET at the same time
+        share one request, each getting its own copy of the result.
+
+        codec encodes request bodies and decodes responses, the default
+        is the fastest available (see default_codec).
+
+        stats_cache is an optional StatsCache for the historical chunks
+        fetched by get_stats_series_range and get_stats_total_range.
+
+        metrics is an optional Metrics, which records latency, bytes and
+        status codes per endpoint; see stats().
+
+        transport sends the requests, by default a SessionTransport on the
+        pooled session.  A RecordingTransport wrapping that records the
+        traffic, which a ReplayTransport can then play back offline.
+        """
+        self.auth = requests.auth.HTTPBasicAuth(marketplaceid, secret)
+        self.session = requests.Session()
+        self.adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+        if transport == None:
+            transport = SessionTransport(self.session, self.auth, timeout)
+        self.transport = transport
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.overflows = 0
+        self.pool_lock = threading.Lock()
+        self.retry = retry
+        self.retries = 0
+        self.retry_failures = 0
+        self.limiter = limiter
+        self.write_limiter = write_limiter
+        self.coalesce = coalesce
+        self.flights = {}
+        self.flight_lock = threading.Lock()
+        if codec == None:
+            codec = default_codec()
+        self.codec = codec
+        self.coalesced = 0
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+        self.userId = userId
+        self.developerId = developerId
+        self.max_workers = max_workers
+        self.cache = cache
+        self.validators = validators
+        self.stats_cache = stats_cache
+        self.metrics = metrics
+        self.base = "https://market.openchannel.io/v2"
+
+    def _request(self, method, url, allow=(), idempotent=None, **kwargs):
+        """
+        Sends a request on the pooled session, raising ApiError unless the
+        status is 200 or in allow.  Failures are retried according to the
+        client's RetryPolicy; idempotent defaults to True for everything
+        except POST.
+        """
+
+        if idempotent == None:
+            idempotent = method != "POST"
+
+        if self.retry == None:
+            return self._send(method, url, allow, **kwargs)
+
+        policy = self.retry
+        start = time.monotonic()
+        retry = 0
+
+        while True:
+
+            resp = None
+            try:
+                resp = self._send(method, url, allow, **kwargs)
+                return resp
+            except ApiError as e:
+                error = e
+                ok = policy.retryable(idempotent, e.code)
+                resp = e.response
+            except requests.exceptions.ConnectTimeout as e:
+                error = e
+                ok = policy.retryable(idempotent, "connect")
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                error = e
+                reason = getattr(e.args[0] if e.args else None, "reason", None)
+                if isinstance(reason, urllib3.exceptions.NewConnectionError):
+                    ok = policy.retryable(idempotent, "connect")
+                else:
+                    ok = policy.retryable(idempotent, "network")
+
+            if ok and retry + 1 < policy.max_attempts:
+                delay = policy.delay(retry, resp)
+                if policy.deadline != None:
+                    ok = time.monotonic() + delay - start <= policy.deadline
+            else:
+                ok = False
+
+            if not ok:
+                if retry > 0:
+                    with self.pool_lock:
+                        self.retry_failures += 1
+                if isinstance(error, ApiError):
+                    error.retries = retry
+                raise error
+
+            # Streamed bodies have to be rewound to be sent again.
+            if hasattr(kwargs.get("data"), "seek"):
+                kwargs["data"].seek(0)
+
+            if self.metrics != None:
+                self.metrics.retry(method, url, self.base)
+
+            time.sleep(delay)
+            retry += 1
+            with self.pool_lock:
+                self.retries += 1
+
+    def retry_stats(self):
+        """
+        Returns the number of retries made, and the number of requests
+        which failed even after retrying.
+        """
+        with self.pool_lock:
+            return { "retries": self.retries, "failures": self.retry_failures }
+
+    def _limiter(self, method):
+        if method in ("POST", "DELETE") and self.write_limiter != None:
+            return self.write_limiter
+        return self.limiter
+
+    def _send(self, method, url, allow=(), **kwargs):
+
+        limiter = self._limiter(method)
+        if limiter != None:
+            limiter.acquire()
+
+        with self.pool_lock:
+            self.in_flight += 1
+            if self.in_flight > self.peak_in_flight:
+                self.peak_in_flight = self.in_flight
+            if self.in_flight > self.pool_maxsize:
+                self.overflows += 1
+
+        metrics = self.metrics
+        if metrics != None:
+            event = metrics.start(method, url, self.base, kwargs.get("data"))
+
+        try:
+            resp = self.transport.request(method, url, **kwargs)
+        except Exception as e:
+            if metrics != None:
+                metrics.end(event, error=e)
+            raise
+        finally:
+            with self.pool_lock:
+                self.in_flight -= 1
+
+        if metrics != None:
+            # Streamed bodies haven't been read yet, so go by the header.
+            if kwargs.get("stream"):
+                received = int(resp.headers.get("Content-Length", 0))
+            else:
+                received = len(resp.content)
+            metrics.end(event, resp.status_code, received, allow=allow)
+
+        if resp.status_code != 200 and resp.status_code not in allow:
+            raise ApiError(resp.status_code, resp.text, response=resp)
+
+        return resp
+
+    def stats(self):
+        """
+        Returns a snapshot of all the client's counters: the pool, retry,
+        coalescing and upload stats, those of any caches and rate limiters,
+        and the per-endpoint metrics if enabled.
+        """
+
+        stats = {
+            "pool": self.pool_stats(),
+            "retry": self.retry_stats(),
+            "coalesce": self.coalesce_stats(),
+            "upload": self.upload_stats(),
+        }
+
+        for name in ["cache", "validators", "stats_cache", "limiter",
+                     "write_limiter"]:
+            value = getattr(self, name)
+            if value != None:
+                stats[name] = value.stats()
+
+        if self.metrics != None:
+            stats["endpoints"] = self.metrics.snapshot()
+
+        return stats
+
+    def pool_stats(self):
+        """
+        Returns connection pool utilisation as a dict.  overflows counts
+        requests made while more than pool_maxsize were already in flight,
+        i.e. ones which had to wait for, or open, an extra connection.
+        """
+
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool == None:
+                continue
+            hosts["%s://%s:%s" % (pool.scheme, pool.host, pool.port)] = {
+                "connections": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool != None else 0,
+            }
+
+        with self.pool_lock:
+            return {
+                "maxsize": self.pool_maxsize,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "overflows": self.overflows,
+                "hosts": hosts,
+            }
+
+    def _body(self, obj, partial):
+        """
+        Encodes an update request body, with partial=True only the changed
+        members of obj.
+        """
+        if partial:
+            return self.codec.encode(obj.changes())
+        return self.codec.encode(obj)
+
+    def _get(self, url, headers=None):
+
+        if not self.coalesce:
+            return self._fetch(url, headers)
+
+        with self.flight_lock:
+            flight = self.flights.get(url)
+            leader = flight == None
+            if leader:
+                flight = Flight()
+                self.flights[url] = flight
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error != None:
+                raise flight.error
+            return copy.deepcopy(flight.data)
+
+        try:
+            flight.data = self._fetch(url, headers)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.flight_lock:
+                del self.flights[url]
+                waiters = flight.waiters
+            flight.done.set()
+
+        # Waiters copy the shared result, so the caller mustn't be handed
+        # the same object to modify.
+        if waiters > 0:
+            return copy.deepcopy(flight.data)
+        return flight.data
+
+    def coalesce_stats(self):
+        """
+        Returns the number of GETs which were served by joining a request
+        already in flight.
+        """
+        with self.flight_lock:
+            return {
+                "coalesced": self.coalesced, "in_flight": len(self.flights)
+            }
+
+    def _fetch(self, url, headers=None):
+
+        if self.validators != None:
+            conditional = dict(headers or {}, **self.validators.headers(url))
+        else:
+            conditional = headers
+
+        resp = self._request("GET", url, allow=(304,), headers=conditional)
+
+        if resp.status_code == 304:
+            data = None
+            if self.validators != None:
+                data = self.validators.revalidated(url)
+            if data != None:
+                return data
+            # Evicted while the request was in flight, fetch it outright.
+            resp = self._request("GET", url, headers=headers)
+
+        data = self.codec.decode(resp.content)
+
+        if self.validators != None:
+            self.validators.put(url, resp, data)
+
+        return data
+
+    def _get_cached(self, resource, key, url, headers=None):
+
+        if self.cache == None:
+            return self._get(url, headers)
+
+        data = self.cache.get(resource, key)
+        if data == None:
+            data = self._get(url, headers)
+            self.cache.put(resource, key, data)
+
+        return data
+
+    def _invalidate(self, resource, key):
+        if self.cache != None:
+            self.cache.invalidate(resource, key)
+
+    def _invalidate_app(self, app):
+
+        # Versions and safe names are keyed differently, so match those on
+        # the cached appId.
+        if self.cache != None:
+            match = lambda data: data.get("appId") == app.appId
+            self.cache.invalidate("app", app.appId)
+            self.cache.invalidate("app_version", where=match)
+            self.cache.invalidate("app_safename", where=match)
+
+    def bulk(self, fn, ids, max_workers=None):
+        """
+        Calls fn on each distinct id concurrently, returning a BulkResult
+        per id in the order ids were first seen.  A failure is recorded
+        against its id rather than raised.
+        """
+
+        if max_workers == None:
+            max_workers = self.max_workers
+
+        keys = list(dict.fromkeys(ids))
+        if len(keys) == 0:
+            return []
+
+        workers = min(max_workers, len(keys))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+            return list(ex.map(lambda key: BulkResult(key).call(fn), keys))
+
+    def _batch(self, fn, items, key, max_workers=None):
+        """
+        Generator calling fn(*key(item)[1]) for each item, with at most
+        max_workers in progress, yielding a BulkResult keyed on
+        key(item)[0] for each in input order.  Items are taken from the
+        iterable only as workers become free.  An item key() fails on
+        gets a failed BulkResult keyed on the item itself.
+        """
+
+        if max_workers == None:
+            max_workers = self.max_workers
+
+        def call(item):
+            res = BulkResult(item)
+            try:
+                res.key, args = key(item)
+            except Exception as e:
+                res.error = e
+                return res
+            return res.call(fn, *args)
+
+        items = iter(items)
+        pending = collections.deque()
+        end = object()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as ex:
+
+            try:
+
+                while True:
+
+                    # Keep a few items queued beyond the workers, so none
+                    # go idle while the caller handles a result.
+                    while len(pending) < 2 * max_workers:
+                        item = next(items, end)
+                        if item is end:
+                            break
+                        pending.append(ex.submit(call, item))
+
+                    if len(pending) == 0:
+                        return
+
+                    yield pending.popleft().result()
+
+            finally:
+                for f in pending:
+                    f.cancel()
+
+    def update_users(self, users, partial=False, max_workers=None):
+        """
+        Updates many users concurrently.  users may be any iterable, and
+        is consumed as the batch proceeds.  Returns a BatchReport, which
+        runs the batch as it is iterated over (or by calling its run()).
+        """
+        return BatchReport(self._batch(
+            self.update_user, users,
+            lambda u: (u.userId, (u, partial)), max_workers
+        ))
+
+    def update_developers(self, devs, partial=False, max_workers=None):
+        """
+        Updates many developers concurrently, see update_users.
+        """
+        return BatchReport(self._batch(
+            self.update_developer, devs,
+            lambda d: (d.developerId, (d, partial)), max_workers
+        ))
+
+    def update_ownerships(self, owns, partial=False, max_workers=None):
+        """
+        Updates many ownership records concurrently, see update_users.
+        """
+        return BatchReport(self._batch(
+            self.update_ownership, owns,
+            lambda o: (o.ownershipId, (o, partial)), max_workers
+        ))
+
+    def install_apps(self, installs, max_workers=None):
+        """
+        Installs apps for users concurrently, see update_users.  Each item
+        of installs is a (user, app) pair, which installs the app's first
+        model, or a (user, app, model) triple.  Results are keyed on
+        (userId, appId).
+        """
+
+        def key(item):
+            if len(item) == 2:
+                item = (item[0], item[1], item[1].model[0])
+            return (item[0].userId, item[1].appId), item
+
+        return BatchReport(self._batch(
+            self.install_app, installs, key, max_workers
+        ))
+
+    def _get_page(self, url, page, limit):
+
+        url = "%s&pageNumber=%d&limit=%d" % (url, page, limit)
+
+        return self._get(url)
+
+    def _iter_list(self, url, cls, limit, max_pages=None):
+        """
+        Walks the pages of a list endpoint, yielding objects of type cls.
+        The next page is fetched in the background while the caller
+        consumes the current one, so only two pages are held at a time.
+        At most max_pages are fetched, if given.
+        """
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        try:
+
+            page = 1
+            pending = executor.submit(self._get_page, url, page, limit)
+
+            while pending:
+
+                data = pending.result()
+                items = data.get("list", [])
+
+                pages = data.get("pages")
+                if pages != None:
+                    more = page < pages
+                else:
+                    more = len(items) >= limit
+                if max_pages != None and page >= max_pages:
+                    more = False
+
+                page += 1
+                if more and len(items) > 0:
+                    pending = executor.submit(self._get_page, url, page, limit)
+                else:
+                    pending = None
+
+                for v in items:
+                    yield cls(client=self).parse(v)
+
+                # Drop the page before waiting on the next one.
+                del items, data
+
+        finally:
+            if pending:
+                pending.cancel()
+            executor.shutdown(wait=False)
+
+    def _stream_list(self, url, cls, limit, chunk_size=65536):
+        """
+        Walks the pages of a list endpoint as _iter_list does, but yields
+        objects of type cls from each page's list array while it is still
+        arriving, rather than decoding the whole page first.  Streamed
+        requests bypass coalescing and the validator cache.
+        """
+
+        page = 1
+
+        while True:
+
+            url_page = "%s&pageNumber=%d&limit=%d" % (url, page, limit)
+            resp = self._request("GET", url_page, stream=True)
+            count = 0
+            try:
+                stream = ListStream(resp.iter_content(chunk_size))
+                for v in stream:
+                    count += 1
+                    yield cls(client=self).parse(v)
+            finally:
+                resp.close()
+
+            pages = stream.meta.get("pages")
+            if pages != None:
+                more = page < pages
+            else:
+                more = count >= limit
+
+            if not more or count == 0:
+                return
+            page += 1
+
+    def list_apps(self, query=None):
+
+        if query == None:
+            query = { "status.value": "approved" }
+
+        url = "%s/apps?query=%s&sort=%s&userId=%s" % (
+            self.base, query, {"randomize": 1}, self.userId
+        )
+
+        return [App(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def iter_apps(self, query=None, limit=100, sort=None,
+                  max_pages=None):
+        """
+        Iterates over apps page by page, see list_apps.  Yields
+        objects as each page arrives, while prefetching the next page.
+        Pages come in a fixed order, by appId unless sort says otherwise;
+        list_apps' random order would repeat and skip apps across pages.
+        """
+
+        if query == None:
+            query = { "status.value": "approved" }
+
+        if sort == None:
+            sort = { "appId": 1 }
+
+        url = "%s/apps?query=%s&sort=%s&userId=%s" % (
+            self.base, query, sort, self.userId
+        )
+
+        return self._iter_list(url, App, limit, max_pages)
+
+    def stream_apps(self, query=None, limit=1000, sort=None):
+        """
+        Yields the apps of iter_apps one at a time, parsing each page of
+        limit apps as it arrives, so memory use doesn't grow with the page
+        size or the list.
+        """
+
+        if query == None:
+            query = { "status.value": "approved" }
+
+        if sort == None:
+            sort = { "appId": 1 }
+
+        url = "%s/apps?query=%s&sort=%s&userId=%s" % (
+            self.base, query, sort, self.userId
+        )
+
+        return self._stream_list(url, App, limit)
+
+    def search_apps(self, text, query=None, fields=None):
+
+        if query == None:
+            query = { "status.value": "approved" }
+
+        if fields == None:
+            fields = [
+                "name", "customData.summary", "customData.description"
+            ]
+
+        url = "%s/apps?query=%s&textSearch=%s&fields=%s&userId=%s" % (
+            self.base, query, text, fields, self.userId
+        )
+
+        return [App(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def list_app_versions(self, query=None):
+
+        if query == None:
+            query = { "status.value": "approved" }
+
+        url = "%s/apps/versions?query=%s&sort=%s&developerId=%s" % (
+            self.base, query, {"randomize": 1}, self.developerId
+        )
+
+        return [App(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def iter_app_versions(self, query=None, limit=100, sort=None,
+                          max_pages=None):
+        """
+        Iterates over app versions page by page, see list_app_versions.  Yields
+        objects as each page arrives, while prefetching the next page.
+        Pages come in a fixed order, as for iter_apps.
+        """
+
+        if query == None:
+            query = { "status.value": "approved" }
+
+        if sort == None:
+            sort = { "appId": 1, "version": 1 }
+
+        url = "%s/apps/versions?query=%s&sort=%s&developerId=%s" % (
+            self.base, query, sort, self.developerId
+        )
+
+        return self._iter_list(url, App, limit, max_pages)
+
+    def delete_app(self, app):
+
+        url = "%s/apps/%s?developerId=%s" % (
+            self.base, app.appId, self.developerId
+        )
+
+        self._request("DELETE", url)
+
+        self._invalidate_app(app)
+
+    def delete_app_version(self, app, version):
+
+        url = "%s/apps/%s/versions/%s?developerId=%s" % (
+            self.base, app.appId, version, self.developerId
+        )
+
+        self._request("DELETE", url)
+
+        self._invalidate_app(app)
+
+    def create_app(self, app):
+
+        headers = { "Content-Type": "application/json" }
+        request = self.codec.encode(app)
+
+        url = "%s/apps?developerId=%s" % (
+            self.base, self.developerId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers)
+        
+        return App(client=self).parse(self.codec.decode(resp.content))
+
+    def update_app(self, app, version, partial=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = self._body(app, partial)
+
+        url = "%s/apps/%s/versions/%s?developerId=%s" % (
+            self.base, app.appId, version, self.developerId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+
+        self._invalidate_app(app)
+        
+        return App(client=self).parse(self.codec.decode(resp.content))
+
+    def publish_app_version(self, app, version, autoApprove=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = {
+            "version": version,
+            "developerId": self.developerId,
+            "autoApprove": autoApprove
+        }
+        
+        url = "%s/apps/%s/publish" % (self.base, app.appId)
+
+        self._request("POST", url, data=self.codec.encode(request),
+                      headers=headers, idempotent=True)
+
+        self._invalidate_app(app)
+
+    def get_app_version(self, id, version):
+
+        headers = { "Content-Type": "application/json" }
+
+        url = "%s/apps/%s/versions/%s?developerId=%s" % (
+            self.base, id, version, self.developerId
+        )
+
+        return App(client=self).parse(
+            self._get_cached("app_version", (id, version), url, headers)
+        )
+
+    def get_app(self, id):
+
+        headers = { "Content-Type": "application/json" }
+
+        url = "%s/apps/%s?userId=%s" % (
+            self.base, id, self.userId
+        )
+
+        return App(client=self).parse(
+            self._get_cached("app", id, url, headers)
+        )
+
+    def get_apps(self, ids, max_workers=None):
+        """
+        Fetches many apps concurrently, returns a list of BulkResult, one
+        per distinct id, in input order.
+        """
+        return self.bulk(self.get_app, ids, max_workers)
+
+    def change_live_version(self, app, version, autoApprove=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = {
+            "version": version,
+            "developerId": self.developerId
+        }
+        
+        url = "%s/apps/%s/live" % (self.base, app.appId)
+
+        self._request("POST", url, data=self.codec.encode(request),
+                      headers=headers, idempotent=True)
+
+        self._invalidate_app(app)
+
+    def status_change(self, app, status, reason):
+
+        headers = { "Content-Type": "application/json" }
+        request = {
+            "status": status,
+            "reason": reason,
+            "developerId": self.developerId
+        }
+        
+        url = "%s/apps/%s/status" % (self.base, app.appId)
+
+        self._request("POST", url, data=self.codec.encode(request),
+                      headers=headers, idempotent=True)
+
+        self._invalidate_app(app)
+
+    def upload_file(self, filename, data=None, path=None, progress=None,
+                    chunk_size=65536):
+        """
+        Uploads a file, whose content is data (bytes, str, memoryview or a
+        binary file object) or the file at path.  The request body is
+        streamed chunk_size bytes at a time.  progress, if given, is called
+        as progress(sent, total, elapsed) as the upload proceeds.
+        """
+
+        url = "%s/files" % self.base
+
+        body = MultipartBody(filename, data, path, progress, chunk_size)
+        headers = { "Content-Type": body.content_type }
+
+        try:
+            resp = self._request("POST", url, data=body, headers=headers)
+        finally:
+            body.close()
+
+        with self.pool_lock:
+            self.upload_bytes += body.sent
+            if body.started != None:
+                self.upload_seconds += time.monotonic() - body.started
+
+        return File().parse(self.codec.decode(resp.content))
+
+    def upload_files(self, paths, index=None, max_workers=None):
+        """
+        Uploads many files concurrently.  Content is identified by its
+        SHA-256, so each distinct content is uploaded once, and if index
+        (an UploadIndex) is given, content it records as already uploaded
+        is skipped and new uploads are added to it.  Returns an
+        UploadReport.
+        """
+
+        if max_workers == None:
+            max_workers = self.max_workers
+
+        paths = list(dict.fromkeys(paths))
+        report = UploadReport()
+
+        start = time.monotonic()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as ex:
+
+            # Group the inputs by content, taking one path per digest.
+            todo = {}
+            hashes = zip(paths, ex.map(
+                lambda p: BulkResult(p).call(file_digest), paths
+            ))
+            for path, res in hashes:
+                if not res.ok():
+                    report.errors[path] = res.error
+                    continue
+                key, size = res.value
+                if key not in todo:
+                    todo[key] = (size, [])
+                todo[key][1].append(path)
+
+            def upload(key):
+                size, group = todo[key]
+                file = None
+                if index != None:
+                    file = index.get(key)
+                if file != None:
+                    return file, False
+                file = self.upload_file(os.path.basename(group[0]),
+                                        path=group[0])
+                if index != None:
+                    index.put(key, file)
+                return file, True
+
+            try:
+                results = ex.map(lambda k: BulkResult(k).call(upload), todo)
+                for res in results:
+                    size, group = todo[res.key]
+                    report.add(group, size, res)
+            finally:
+                if index != None:
+                    index.save()
+
+        report.seconds = time.monotonic() - start
+
+        return report
+
+    def upload_stats(self):
+        """
+        Returns the bytes uploaded by upload_file, the time spent, and the
+        resulting rate in bytes/second.
+        """
+        with self.pool_lock:
+            rate = 0.0
+            if self.upload_seconds > 0:
+                rate = self.upload_bytes / self.upload_seconds
+            return {
+                "bytes": self.upload_bytes, "seconds": self.upload_seconds,
+                "rate": rate,
+            }
+
+    def upload_url(self, u):
+
+        headers = { "Content-Type": "application/json" }
+        request = {
+            "url": u
+        }
+        
+        url = "%s/files/url" % self.base
+
+        resp = self._request("POST", url, data=self.codec.encode(request),
+                             headers=headers)
+
+        return File().parse(self.codec.decode(resp.content))
+
+    def get_app_by_safename(self, safename):
+
+        headers = { "Content-Type": "application/json" }
+
+        url = "%s/apps/bySafeName/%s?userId=%s" % (
+            self.base, safename, self.userId
+        )
+
+        return App(client=self).parse(
+            self._get_cached("app_safename", safename, url, headers)
+        )
+
+    def get_developer(self, id):
+
+        url = "%s/developers/%s" % ( self.base, id )
+
+        return Developer(client=self).parse(
+            self._get_cached("developer", id, url)
+        )
+
+    def get_developers(self, ids, max_workers=None):
+        """
+        Fetches many developers concurrently, returns a list of BulkResult, one
+        per distinct id, in input order.
+        """
+        return self.bulk(self.get_developer, ids, max_workers)
+
+    def list_developers(self, query=None):
+
+        if query == None:
+            query = {}
+
+        url = "%s/developers?query=%s&sort=%s" % (
+            self.base, query, {"name": 1}
+        )
+
+        return [Developer(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def iter_developers(self, query=None, limit=100, sort=None,
+                        max_pages=None):
+        """
+        Iterates over developers page by page, see list_developers.  Yields
+        objects as each page arrives, while prefetching the next page.
+        """
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "name": 1, "developerId": 1 }
+
+        url = "%s/developers?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, Developer, limit, max_pages)
+
+    def update_developer(self, dev, partial=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = self._body(dev, partial)
+
+        url = "%s/developers/%s" % (
+            self.base, dev.developerId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+
+        self._invalidate("developer", dev.developerId)
+        
+        return Developer(client=self).parse(self.codec.decode(resp.content))
+
+    def get_developer_group(self, id):
+
+        url = "%s/developers/groups/%s" % ( self.base, id )
+
+        return DeveloperGroup(client=self).parse(
+            self._get_cached("developer_group", id, url)
+        )
+
+    def update_developer_group(self, group):
+
+        headers = { "Content-Type": "application/json" }
+        request = self.codec.encode(group)
+
+        url = "%s/developers/groups/%s" % (
+            self.base, group.groupId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+
+        self._invalidate("developer_group", group.groupId)
+        
+        return DeveloperGroup(client=self).parse(
+            self.codec.decode(resp.content)
+        )
+
+    def get_user(self, id):
+
+        url = "%s/users/%s" % ( self.base, id )
+
+        return User(client=self).parse(self._get_cached("user", id, url))
+
+    def get_users(self, ids, max_workers=None):
+        """
+        Fetches many users concurrently, returns a list of BulkResult, one
+        per distinct id, in input order.
+        """
+        return self.bulk(self.get_user, ids, max_workers)
+
+    def list_users(self, query=None):
+
+        if query == None:
+            query = {}
+
+        url = "%s/users?query=%s&sort=%s" % (
+            self.base, query, {"name": 1}
+        )
+
+        return [User(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def iter_users(self, query=None, limit=100, sort=None,
+                   max_pages=None):
+        """
+        Iterates over users page by page, see list_users.  Yields
+        objects as each page arrives, while prefetching the next page.
+        """
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "name": 1, "userId": 1 }
+
+        url = "%s/users?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, User, limit, max_pages)
+
+    def update_user(self, user, partial=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = self._body(user, partial)
+
+        url = "%s/users/%s" % (
+            self.base, user.userId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+
+        self._invalidate("user", user.userId)
+        
+        return User(client=self).parse(self.codec.decode(resp.content))
+
+    def get_user_group(self, id):
+
+        url = "%s/users/groups/%s" % ( self.base, id )
+
+        return UserGroup(client=self).parse(
+            self._get_cached("user_group", id, url)
+        )
+
+    def update_user_group(self, group):
+
+        headers = { "Content-Type": "application/json" }
+        request = self.codec.encode(group)
+
+        url = "%s/users/groups/%s" % (
+            self.base, group.groupId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+
+        self._invalidate("user_group", group.groupId)
+        
+        return UserGroup(client=self).parse(self.codec.decode(resp.content))
+    
+    def get_stats_total(self, start=None, end=None, query=None, fields=None):
+
+        if query == None:
+            query = {}
+
+        if start == None: start = int(time.time() - 86400) * 1000
+        if end == None: end = int(time.time()) * 1000
+
+        if fields == None:
+            fields = [
+                "views", "downloads"
+            ]
+        fields = ",".join(fields)
+
+        url = "%s/stats/total?query=%s&start=%d&end=%d&fields=%s" % (
+            self.base, query, start, end, fields
+        )
+
+        return Stats().parse(self._get(url))
+
+    def get_stats_series(self, start=None, end=None, query=None, field=None,
+                         period="day"):
+
+        if query == None:
+            query = {}
+        query = json.dumps(query)
+
+        if start == None: start = int(time.time() - 86400) * 1000
+        if end == None: end = int(time.time()) * 1000
+
+        if field == None:
+            field = "downloads"
+
+        url = "%s/stats/series/%s/%s?query=%s&start=%d&end=%d" % (
+            self.base, period, field, query, start, end
+        )
+
+        return self._get(url)
+
+    def _stats_chunks(self, fetch, plan, parts, max_workers=None):
+        """
+        Calls fetch(start, end) for each chunk of plan concurrently,
+        taking historical chunks from the stats cache where it has them.
+        parts identify the query in the cache.  Returns results in order.
+        """
+
+        cache = self.stats_cache
+        keys = {}
+        results = {}
+
+        for a, b in plan:
+            if cache != None and cache.final(b):
+                keys[(a, b)] = cache.key(self.auth.username, self.base, a, b,
+                                         *parts)
+                value = cache.get(keys[(a, b)])
+                if value != None:
+                    results[(a, b)] = value
+
+        missing = [c for c in plan if c not in results]
+        for res in self.bulk(lambda c: fetch(*c), missing, max_workers):
+            if res.error != None:
+                raise res.error
+            results[res.key] = res.value
+            if res.key in keys:
+                cache.put(keys[res.key], res.value)
+
+        return [results[c] for c in plan]
+
+    def get_stats_series_range(self, start, end, query=None, field=None,
+                               period="day", chunk=None, max_workers=None):
+        """
+        As get_stats_series, but splits the window into chunks of chunk
+        periods (see RangePlanner), fetches them concurrently and joins
+        them in order.
+        """
+
+        if query == None:
+            query = {}
+
+        if field == None:
+            field = "downloads"
+
+        plan = RangePlanner(period, chunk).plan(start, end)
+
+        return merge_series(self._stats_chunks(
+            lambda a, b: self.get_stats_series(a, b, query, field, period),
+            plan, ("series", query, field, period), max_workers
+        ))
+
+    def get_stats_total_range(self, start, end, query=None, fields=None,
+                              period="day", chunk=None, max_workers=None):
+        """
+        As get_stats_total, but fetches the window in chunks, as
+        get_stats_series_range, adding up the totals.
+        """
+
+        if query == None:
+            query = {}
+
+        if fields == None:
+            fields = [
+                "views", "downloads"
+            ]
+
+        plan = RangePlanner(period, chunk).plan(start, end)
+
+        parts = self._stats_chunks(
+            lambda a, b: plain(self.get_stats_total(a, b, query, fields)),
+            plan, ("total", query, fields), max_workers
+        )
+
+        return Stats().parse(functools.reduce(merge_totals, parts, {}))
+
+    def get_stats_columns(self, start=None, end=None, fields=None, apps=None,
+                          query=None, period="day", max_workers=None):
+        """
+        Fetches the series of each of fields, for each app id in apps or
+        across all apps if apps is None, concurrently.  Returns a
+        StatsSeries.
+        """
+
+        if query == None:
+            query = {}
+
+        if start == None: start = int(time.time() - 86400) * 1000
+        if end == None: end = int(time.time()) * 1000
+
+        if fields == None:
+            fields = [ "downloads" ]
+
+        if apps == None:
+            apps = [None]
+
+        def fetch(key):
+            app, field = key
+            q = dict(query)
+            if app != None:
+                q["appId"] = app
+            return self.get_stats_series(start, end, q, field, period)
+
+        series = StatsSeries(period)
+        keys = [(app, field) for app in apps for field in fields]
+        for res in self.bulk(fetch, keys, max_workers):
+            if res.error != None:
+                raise res.error
+            series.add(res.key[0], res.key[1], res.value)
+
+        return series
+
+    def install_app(self, user, app, model):
+
+        headers = { "Content-Type": "application/json" }
+        request = {
+            "appId": app.appId,
+            "userId": user.userId,
+            "modelId": model.modelId
+        }
+
+        url = "%s/ownership/install" % (
+            self.base
+        )
+
+        resp = self._request("POST", url, data=self.codec.encode(request),
+                             headers=headers)
+        
+        return Ownership(client=self).parse(self.codec.decode(resp.content))
+
+    def get_ownership(self, id):
+
+        url = "%s/ownership/%s" % ( self.base, id )
+
+        return Ownership(client=self).parse(self._get(url))
+
+    def get_ownerships(self, ids, max_workers=None):
+        """
+        Fetches many ownership records concurrently, returns a list of
+        BulkResult, one per distinct id, in input order.
+        """
+        return self.bulk(self.get_ownership, ids, max_workers)
+
+    def list_ownership(self, query=None):
+
+        if query == None:
+            query = {}
+
+        url = "%s/ownership?query=%s&sort=%s" % (
+            self.base, query, {"date": 1}
+        )
+
+        return [Ownership(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def iter_ownership(self, query=None, limit=100, sort=None,
+                       max_pages=None):
+        """
+        Iterates over ownership records page by page, see list_ownership.
+        Yields objects as each page arrives, while prefetching the next
+        page.
+        """
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": 1, "ownershipId": 1 }
+
+        url = "%s/ownership?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, Ownership, limit, max_pages)
+
+    def stream_ownership(self, query=None, limit=1000, sort=None):
+        """
+        Yields the records of iter_ownership one at a time, see
+        stream_apps.
+        """
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": 1, "ownershipId": 1 }
+
+        url = "%s/ownership?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._stream_list(url, Ownership, limit)
+
+    def uninstall_app(self, own):
+
+        headers = { "Content-Type": "application/json" }
+        request = {
+            "userId": own.userId
+        }
+
+        url = "%s/ownership/uninstall/%s" % (
+            self.base, own.ownershipId
+        )
+
+        self._request("POST", url, data=self.codec.encode(request),
+                      headers=headers)
+
+    def update_ownership(self, own, partial=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = self._body(own, partial)
+
+        url = "%s/ownership/%s" % (
+            self.base, own.ownershipId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+
+        return Ownership(client=self).parse(self.codec.decode(resp.content))
+
+    def create_review(self, review):
+
+        headers = { "Content-Type": "application/json" }
+        request = self.codec.encode(review)
+
+        url = "%s/reviews" % (
+            self.base
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers)
+        
+        return Review(client=self).parse(self.codec.decode(resp.content))
+
+    def update_review(self, review, partial=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = self._body(review, partial)
+
+        url = "%s/reviews/%s" % (
+            self.base, review.reviewId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+        
+        return Review(client=self).parse(self.codec.decode(resp.content))
+
+    def get_review(self, id):
+
+        url = "%s/reviews/%s" % (
+            self.base, id
+        )
+
+        return Review(client=self).parse(self._get(url))
+
+    def get_review_by_app_user(self, app, user):
+
+        url = "%s/reviews/apps/%s/users/%s" % (
+            self.base, app.appId, user.userId
+        )
+
+        return Review(client=self).parse(self._get(url))
+
+    def list_reviews(self, query=None):
+
+        if query == None:
+            query = {}
+
+        url = "%s/reviews?query=%s&sort=%s&userId=%s" % (
+            self.base, query, {"date": 1}, self.userId
+        )
+
+        return [Review(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def iter_reviews(self, query=None, limit=100, sort=None,
+                     max_pages=None):
+        """
+        Iterates over reviews page by page, see list_reviews.  Yields
+        objects as each page arrives, while prefetching the next page.
+        """
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": 1, "reviewId": 1 }
+
+        url = "%s/reviews?query=%s&sort=%s&userId=%s" % (
+            self.base, query, sort, self.userId
+        )
+
+        return self._iter_list(url, Review, limit, max_pages)
+
+    def get_market(self):
+
+        url = "%s/markets/this" % (
+            self.base
+        )
+
+        return Market(client=self).parse(
+            self._get_cached("market", "this", url)
+        )
+
+    def add_permission(self, app, perm):
+
+        headers = { "Content-Type": "application/json" }
+        request = self.codec.encode(perm)
+
+        url = "%s/permission/apps/%s" % (
+            self.base, app.appId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+        
+        return Permission(client=self).parse(self.codec.decode(resp.content))
+
+    def get_permission(self, app, user):
+
+        url = "%s/permission/apps/%s?userId=%s" % (
+            self.base, app.appId, user.userId
+        )
+
+        return Permission(client=self).parse(self._get(url))
+
+    def delete_permission(self, app, user):
+
+        url = "%s/permission/apps/%s?userId=%s" % (
+            self.base, app.appId, user.userId
+        )
+
+        self._request("DELETE", url)
+
+    def list_transactions(self, query=None):
+
+        if query == None:
+            query = {}
+
+        url = "%s/transactions?query=%s&sort=%s" % (
+            self.base, query, {"date": -1}
+        )
+
+        return [Transaction(client=self).parse(v) for v in self._get(url)["list"]]
+
+    def iter_transactions(self, query=None, limit=100, sort=None,
+                          max_pages=None):
+        """
+        Iterates over transactions page by page, see list_transactions.  Yields
+        objects as each page arrives, while prefetching the next page.
+        """
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": -1, "transactionId": 1 }
+
+        url = "%s/transactions?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, Transaction, limit, max_pages)
+
+    def stream_transactions(self, query=None, limit=1000, sort=None):
+        """
+        Yields the transactions of iter_transactions one at a time, see
+        stream_apps.
+        """
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": -1, "transactionId": 1 }
+
+        url = "%s/transactions?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._stream_list(url, Transaction, limit)
+
+    def update_transaction(self, trans, partial=False):
+
+        headers = { "Content-Type": "application/json" }
+        request = self._body(trans, partial)
+
+        url = "%s/transactions/%s" % (
+            self.base, trans.transactionId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers,
+                             idempotent=True)
+        
+        return Transaction(client=self).parse(self.codec.decode(resp.content))
+
+    def custom_gateway_add_payment(self, own, trans):
+
+        headers = { "Content-Type": "application/json" }
+        request = self.codec.encode(trans)
+
+        url = "%s/custom-gateway/payment/%s" % (
+            self.base, own.ownershipId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers)
+        
+        return Transaction(client=self).parse(self.codec.decode(resp.content))
+
+    def custom_gateway_add_refund(self, own, trans):
+
+        headers = { "Content-Type": "application/json" }
+        request = self.codec.encode(trans)
+
+        url = "%s/custom-gateway/refund/%s" % (
+            self.base, own.ownershipId
+        )
+
+        resp = self._request("POST", url, data=request, headers=headers)
+        
+        return Transaction(client=self).parse(self.codec.decode(resp.content))
+
+    def get_transaction(self, id):
+
+        url = "%s/transactions/%s" % ( self.base, id )
+
+        return Transaction(client=self).parse(self._get(url))
+
+    def get_transactions(self, ids, max_workers=None):
+        """
+        Fetches many transactions concurrently, returns a list of
+        BulkResult, one per distinct id, in input order.
+        """
+        return self.bulk(self.get_transaction, ids, max_workers)
+
+    def delete_transaction(self, trans):
+
+        url = "%s/transactions/%s" % (
+            self.base, trans.transactionId
+        )
+
+        self._request("DELETE", url)
+
+def iter_modified(iterate, query, field, ids, since=None, limit=100):
+    """
+    Yields, oldest first, the records of a Client iter_* call (iterate)
+    matching query whose modified field is no earlier than since, or all
+    of them if since is None.  ids are the members identifying a record.
+
+    Each page is a fresh query from the latest modified time seen, rather
+    than the next pageNumber of one query, whose later pages shift when a
+    record is modified meanwhile so that others are skipped.  Records
+    already seen at that time are dropped, and if they fill a whole page,
+    the next one is made larger to get past them.
+    """
+
+    sort = { field: 1 }
+    for v in ids:
+        sort[v] = 1
+
+    seen = set()
+    size = limit
+
+    while True:
+
+        q = dict(query)
+        if since != None:
+            q[field] = { "$gte": since }
+
+        count = 0
+        new = 0
+        for obj in iterate(q, size, sort, max_pages=1):
+            count += 1
+            modified = getattr(obj, field, None)
+            key = tuple(getattr(obj, v, None) for v in ids)
+            if since != None and (modified == None or modified < since):
+                continue
+            if modified == since:
+                if key in seen:
+                    continue
+            else:
+                since = modified
+                seen = set()
+            seen.add(key)
+            new += 1
+            yield obj
+
+        if count < size:
+            return
+        size = limit if new > 0 else 2 * size
+
+class Mirror:
+    """
+    Local copy of the marketplace catalogue in an SQLite database, kept up
+    to date by sync().  Each sync fetches, oldest first, the records whose
+    modified field (lastUpdated by default) is no earlier than the latest
+    seen by the previous one, through iter_modified.  Records modified in
+    that same millisecond are fetched again, and simply replace the stored
+    copy.  Records deleted on the server aren't noticed by an incremental
+    sync; sync(full=True) starts again from scratch.
+
+    Reads such as get_app() are answered from the database, returning the
+    usual objects bound to the client.
+    """
+
+    # kind: (Client iterator, class, id members)
+    kinds = {
+        "apps": ("iter_apps", App, ("appId",)),
+        "app_versions": ("iter_app_versions", App, ("appId", "version")),
+        "developers": ("iter_developers", Developer, ("developerId",)),
+        "users": ("iter_users", User, ("userId",)),
+        "reviews": ("iter_reviews", Review, ("reviewId",)),
+    }
+
+    def __init__(self, client, path, modified=None, queries=None,
+                 limit=100):
+        """
+        Constructor, path=database file.  modified maps a kind to the
+        member holding its modification time, if not lastUpdated.
+        queries maps a kind to extra query terms for its list call, e.g.
+        { "apps": { "status.value": "approved" } }.
+        """
+        if modified == None:
+            modified = {}
+        if queries == None:
+            queries = {}
+        self.client = client
+        self.path = path
+        self.modified = modified
+        self.queries = queries
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS sync "
+                "(kind TEXT PRIMARY KEY, modified REAL, time REAL)"
+            )
+            for kind in self.kinds:
+                self.db.execute(
+                    "CREATE TABLE IF NOT EXISTS %s "
+                    "(id TEXT PRIMARY KEY, modified REAL, data BLOB)" % kind
+                )
+
+    def close(self):
+        self.db.close()
+
+    def _key(self, kind, values):
+        return "/".join(str(v) for v in values)
+
+    def sync(self, kinds=None, full=False):
+        """
+        Brings the mirror up to date, returning per-kind statistics: the
+        number of records fetched, the time taken, and records/second.
+        """
+
+        if kinds == None:
+            kinds = list(self.kinds)
+
+        report = {}
+        for kind in kinds:
+            report[kind] = self._sync(kind, full)
+        return report
+
+    def _sync(self, kind, full):
+
+        method, _, ids = self.kinds[kind]
+        field = self.modified.get(kind, "lastUpdated")
+
+        with self.lock:
+            if full:
+                with self.db:
+                    self.db.execute("DELETE FROM %s" % kind)
+                    self.db.execute("DELETE FROM sync WHERE kind=?", (kind,))
+            row = self.db.execute(
+                "SELECT modified FROM sync WHERE kind=?", (kind,)
+            ).fetchone()
+
+        since = row[0] if row != None else None
+        query = self.queries.get(kind, {})
+
+        start = time.monotonic()
+        count = 0
+        latest = since
+        rows = []
+
+        def flush():
+            with self.lock, self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO %s VALUES (?, ?, ?)" % kind, rows
+                )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO sync VALUES (?, ?, ?)",
+                    (kind, latest, time.time())
+                )
+            del rows[:]
+
+        # Oldest first, so the watermark only moves past records already
+        # stored.
+        records = iter_modified(
+            getattr(self.client, method), query, field, ids, since, self.limit
+        )
+
+        for obj in records:
+            fields = obj.fields()
+            modified = fields.get(field)
+            if modified != None and (latest == None or modified > latest):
+                latest = modified
+            key = self._key(kind, [fields.get(v) for v in ids])
+            rows.append((key, modified, self.client.codec.encode(obj)))
+            count += 1
+            if len(rows) >= self.limit:
+                flush()
+
+        flush()
+
+        seconds = time.monotonic() - start
+        return {
+            "records": count, "seconds": seconds,
+            "rate": count / seconds if seconds > 0 else 0.0,
+        }
+
+    def _get(self, kind, *key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT data FROM %s WHERE id=?" % kind,
+                (self._key(kind, key),)
+            ).fetchone()
+        if row == None:
+            return None
+        return self.kinds[kind][1](client=self.client).parse(
+            self.client.codec.decode(row[0])
+        )
+
+    def _all(self, kind):
+        with self.lock:
+            rows = self.db.execute("SELECT data FROM %s" % kind).fetchall()
+        cls = self.kinds[kind][1]
+        for row in rows:
+            yield cls(client=self.client).parse(
+                self.client.codec.decode(row[0])
+            )
+
+    def get_app(self, id):
+        """
+        Returns the app from the mirror, or None if it isn't there.
+        """
+        return self._get("apps", id)
+
+    def get_app_version(self, id, version):
+        return self._get("app_versions", id, version)
+
+    def get_developer(self, id):
+        return self._get("developers", id)
+
+    def get_user(self, id):
+        return self._get("users", id)
+
+    def get_review(self, id):
+        return self._get("reviews", id)
+
+    def apps(self):
+        """
+        Iterates over all mirrored apps.
+        """
+        return self._all("apps")
+
+    def app_versions(self):
+        return self._all("app_versions")
+
+    def developers(self):
+        return self._all("developers")
+
+    def users(self):
+        return self._all("users")
+
+    def reviews(self):
+        return self._all("reviews")
+
+    def last_sync(self, kind):
+        """
+        Returns the time of the last sync of kind, or None.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT time FROM sync WHERE kind=?", (kind,)
+            ).fetchone()
+        return row[0] if row != None else None
+
+class AppIndex:
+    """
+    In-memory index of apps, answering lookups by appId, safeName,
+    developerId, status.value and customData.category, and text searches
+    over the same fields as Client.search_apps, without calling the API.
+    Holds one entry per appId; adding an app replaces the previous entry.
+
+    The objects returned are the ones held by the index, so treat them as
+    read-only.
+    """
+
+    fields = (
+        "appId", "safeName", "developerId", "status.value",
+        "customData.category",
+    )
+
+    text_fields = ("name", "customData.summary", "customData.description")
+
+    def __init__(self, apps=None):
+        self.lock = threading.Lock()
+        self.apps = {}
+        self.indexes = { f: {} for f in self.fields }
+        self.words = {}
+        self.latest = None
+        if apps != None:
+            self.update(apps)
+
+    def __len__(self):
+        return len(self.apps)
+
+    @staticmethod
+    def _values(app, path):
+        value = app
+        for name in path.split("."):
+            value = getattr(value, name, None)
+            if value == None:
+                return []
+        if isinstance(value, list):
+            return value
+        return [value]
+
+    @staticmethod
+    def _tokens(text):
+        return set(re.findall(r"\w+", str(text).lower()))
+
+    def _postings(self, app):
+        keys = [
+            (self.indexes[f], v)
+            for f in self.fields for v in self._values(app, f)
+        ]
+        words = set()
+        for f in self.text_fields:
+            for v in self._values(app, f):
+                words |= self._tokens(v)
+        keys.extend((self.words, w) for w in words)
+        return keys
+
+    def _remove(self, id):
+        app = self.apps.pop(id, None)
+        if app == None:
+            return
+        for index, value in self._postings(app):
+            ids = index.get(value)
+            if ids != None:
+                ids.discard(id)
+                if not ids:
+                    del index[value]
+
+    def add(self, app):
+        """
+        Adds an app, replacing any earlier entry with the same appId.
+        """
+        with self.lock:
+            self._add(app)
+
+    def _add(self, app):
+        id = app.appId
+        self._remove(id)
+        self.apps[id] = app
+        for index, value in self._postings(app):
+            index.setdefault(value, set()).add(id)
+        modified = getattr(app, "lastUpdated", None)
+        if modified != None and (self.latest == None or modified > self.latest):
+            self.latest = modified
+
+    def update(self, apps):
+        """
+        Adds each of an iterable of apps, e.g. the result of list_apps or
+        Mirror.apps().
+        """
+        with self.lock:
+            for app in apps:
+                self._add(app)
+
+    def remove(self, id):
+        with self.lock:
+            self._remove(id)
+
+    def refresh(self, client, query=None, versions=False):
+        """
+        Fetches the apps updated since the latest one in the index, through
+        iter_apps (or iter_app_versions if versions is set), and adds them.
+        Apps are fetched oldest first from the latest one's lastUpdated
+        onwards by iter_modified, so that none are skipped, even if apps
+        are updated meanwhile; those fetched again are simply replaced.
+        Returns the number fetched.
+        """
+
+        if query == None:
+            query = {}
+
+        if versions:
+            apps = iter_modified(client.iter_app_versions, query,
+                                 "lastUpdated", ("appId", "version"),
+                                 self.latest)
+        else:
+            apps = iter_modified(client.iter_apps, query, "lastUpdated",
+                                 ("appId",), self.latest)
+
+        count = 0
+        for app in apps:
+            self.add(app)
+            count += 1
+        return count
+
+    def get(self, id):
+        """
+        Returns the app with this appId, or None.
+        """
+        with self.lock:
+            return self.apps.get(id)
+
+    def get_by_safename(self, safename):
+        with self.lock:
+            ids = self.indexes["safeName"].get(safename)
+            if not ids:
+                return None
+            return self.apps.get(next(iter(ids)))
+
+    def _match(self, query):
+        # Called with the lock held.
+        ids = None
+        for field, value in query.items():
+            found = self.indexes[field].get(value, ())
+            ids = set(found) if ids == None else ids & found
+            if not ids:
+                return set()
+        return ids
+
+    def find(self, query=None):
+        """
+        Returns the apps matching every term of query, a dict from indexed
+        field to value, e.g.
+        { "status.value": "approved", "customData.category": "security" }.
+        """
+
+        with self.lock:
+            if not query:
+                return list(self.apps.values())
+            return [self.apps[id] for id in self._match(query)]
+
+    def search(self, text, query=None):
+        """
+        Returns the apps whose name, summary or description contains every
+        word of text, optionally filtered as find().
+        """
+
+        with self.lock:
+
+            ids = None
+            for word in self._tokens(text):
+                found = self.words.get(word, ())
+                ids = set(found) if ids == None else ids & found
+                if not ids:
+                    return []
+
+            if ids == None:
+                ids = set(self.apps)
+
+            if query:
+                ids &= self._match(query)
+
+            return [self.apps[id] for id in ids]
+
+class AsyncClient:
+    """
+    Asyncio counterpart of Client, built on aiohttp.  Methods have the same
+    names and arguments as Client, but are coroutines.  Objects returned
+    are the same classes, bound to this client, so e.g. app.update() returns
+    an awaitable.  Requests share a pool of at most limit connections.
+    """
+    def __init__(self, marketplaceid, secret, userId=1, developerId=1,
+                 limit=100, limit_per_host=0, timeout=60, retry=None,
+                 limiter=None, write_limiter=None, coalesce=True,
+                 codec=None, stats_cache=None, metrics=None):
+        """
+        Constructor, retry is an optional RetryPolicy, limiter and
+        write_limiter optional RateLimiters as for Client.  With
+        coalesce=True, concurrent identical GETs share one request.
+        codec, stats_cache and metrics are as for Client.
+
+        timeout is in seconds, as for Client either a number or a
+        (connect, read) pair, and applies to connecting and to each read,
+        not the whole request, so long streams and uploads aren't cut off.
+        None waits forever.
+        """
+        if aiohttp == None:
+            raise RuntimeError("AsyncClient requires the aiohttp package")
+        self.auth = aiohttp.BasicAuth(marketplaceid, secret)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect, sock_read=read
+        )
+        self.session = None
+        self.retry = retry
+        self.retries = 0
+        self.retry_failures = 0
+        self.limiter = limiter
+        self.write_limiter = write_limiter
+        self.coalesce = coalesce
+        self.stats_cache = stats_cache
+        self.metrics = metrics
+        self.flights = {}
+        self.coalesced = 0
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+        if codec == None:
+            codec = default_codec()
+        self.codec = codec
+        self.userId = userId
+        self.developerId = developerId
+        self.base = "https://market.openchannel.io/v2"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the connection pool
+        """
+        if self.session != None:
+            await self.session.close()
+            self.session = None
+
+    def _session(self):
+
+        # The session has to be created inside a running event loop.
+        if self.session == None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector, auth=self.auth, timeout=self.timeout
+            )
+        return self.session
+
+    async def _send(self, method, url, stream=False, **kwargs):
+
+        limiter = self.limiter
+        if method in ("POST", "DELETE") and self.write_limiter != None:
+            limiter = self.write_limiter
+        if limiter != None:
+            wait = limiter.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        metrics = self.metrics
+        if metrics != None:
+            event = metrics.start(method, url, self.base, kwargs.get("data"))
+
+        try:
+            resp = await self._session().request(method, url, **kwargs)
+            # With stream=True a successful response is returned unread,
+            # for the caller to read and release.
+            if not stream or resp.status != 200:
+                try:
+                    body = await resp.read()
+                finally:
+                    resp.release()
+        except Exception as e:
+            if metrics != None:
+                metrics.end(event, error=e)
+            raise
+
+        if metrics != None:
+            # Streamed bodies haven't been read yet, so go by the header.
+            if stream and resp.status == 200:
+                received = resp.content_length or 0
+            else:
+                received = len(body)
+            metrics.end(event, resp.status, received)
+
+        if resp.status != 200:
+            raise ApiError(resp.status, body.decode("utf-8", "replace"),
+                           response=resp)
+        if stream:
+            return resp
+        return body
+
+    async def _request(self, method, url, idempotent=None, **kwargs):
+
+        if idempotent == None:
+            idempotent = method != "POST"
+
+        if self.retry == None:
+            return await self._send(method, url, **kwargs)
+
+        policy = self.retry
+        start = time.monotonic()
+        retry = 0
+
+        while True:
+
+            resp = None
+            try:
+                return await self._send(method, url, **kwargs)
+            except ApiError as e:
+                error = e
+                ok = policy.retryable(idempotent, e.code)
+                resp = e.response
+            except aiohttp.ClientConnectorError as e:
+                error = e
+                ok = policy.retryable(idempotent, "connect")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                ok = policy.retryable(idempotent, "network")
+
+            if ok and retry + 1 < policy.max_attempts:
+                delay = policy.delay(retry, resp)
+                if policy.deadline != None:
+                    ok = time.monotonic() + delay - start <= policy.deadline
+            else:
+                ok = False
+
+            if not ok:
+                if retry > 0:
+                    self.retry_failures += 1
+                if isinstance(error, ApiError):
+                    error.retries = retry
+                raise error
+
+            if self.metrics != None:
+                self.metrics.retry(method, url, self.base)
+
+            await asyncio.sleep(delay)
+            retry += 1
+            self.retries += 1
+
+    def retry_stats(self):
+        return { "retries": self.retries, "failures": self.retry_failures }
+
+    def stats(self):
+        """
+        Returns a snapshot of the client's counters, as Client.stats.
+        """
+
+        stats = {
+            "retry": self.retry_stats(),
+            "coalesce": self.coalesce_stats(),
+            "upload": self.upload_stats(),
+        }
+
+        for name in ["stats_cache", "limiter", "write_limiter"]:
+            value = getattr(self, name)
+            if value != None:
+                stats[name] = value.stats()
+
+        if self.metrics != None:
+            stats["endpoints"] = self.metrics.snapshot()
+
+        return stats
+
+    async def _get(self, url, headers=None):
+
+        if not self.coalesce:
+            body = await self._request("GET", url, headers=headers)
+            return self.codec.decode(body)
+
+        flight = self.flights.get(url)
+        if flight != None:
+            flight.waiters += 1
+            self.coalesced += 1
+        else:
+            # The request runs as a task of its own, so that cancelling the
+            # caller which started it doesn't cancel those waiting with it.
+            task = asyncio.ensure_future(self._fetch(url, headers))
+            task.add_done_callback(lambda t: self.flights.pop(url, None))
+            flight = Flight(task)
+            self.flights[url] = flight
+
+        flight.callers += 1
+        try:
+            data = await asyncio.shield(flight.future)
+        except asyncio.CancelledError:
+            flight.callers -= 1
+            if flight.callers == 0:
+                flight.future.cancel()
+            raise
+
+        if flight.waiters > 0:
+            return copy.deepcopy(data)
+        return data
+
+    async def _fetch(self, url, headers=None):
+        body = await self._request("GET", url, headers=headers)
+        return self.codec.decode(body)
+
+    def coalesce_stats(self):
+        return { "coalesced": self.coalesced, "in_flight": len(self.flights) }
+
+    def _body(self, obj, partial):
+        if partial:
+            return self.codec.encode(obj.changes())
+        return self.codec.encode(obj)
+
+    async def _post(self, url, request, idempotent=False):
+        headers = { "Content-Type": "application/json" }
+        body = await self._request("POST", url, data=request, headers=headers,
+                                   idempotent=idempotent)
+        if len(body) == 0:
+            return None
+        return self.codec.decode(body)
+
+    async def _delete(self, url):
+        await self._request("DELETE", url)
+
+    async def bulk(self, fn, ids, max_workers=None):
+        """
+        Awaits fn on each distinct id concurrently, with at most
+        max_workers at once, as Client.bulk.
+        """
+
+        if max_workers == None:
+            max_workers = self.limit
+
+        sem = asyncio.Semaphore(max_workers)
+
+        async def call(key):
+            async with sem:
+                try:
+                    return BulkResult(key, value=await fn(key))
+                except Exception as e:
+                    return BulkResult(key, error=e)
+
+        return list(await asyncio.gather(
+            *[call(key) for key in dict.fromkeys(ids)]
+        ))
+
+    async def _batch(self, fn, items, key, max_workers=None):
+        """
+        Async generator calling fn(*key(item)[1]) for each item, with at
+        most max_workers in progress, as Client._batch.
+        """
+
+        if max_workers == None:
+            max_workers = self.limit
+
+        async def call(item):
+            res = BulkResult(item)
+            start = time.monotonic()
+            try:
+                res.key, args = key(item)
+                res.value = await fn(*args)
+            except Exception as e:
+                res.error = e
+            res.seconds = time.monotonic() - start
+            return res
+
+        items = iter(items)
+        pending = collections.deque()
+        end = object()
+
+        try:
+
+            while True:
+
+                while len(pending) < max_workers:
+                    item = next(items, end)
+                    if item is end:
+                        break
+                    pending.append(asyncio.ensure_future(call(item)))
+
+                if len(pending) == 0:
+                    return
+
+                yield await pending.popleft()
+
+        finally:
+            for f in pending:
+                f.cancel()
+
+    def update_users(self, users, partial=False, max_workers=None):
+        """
+        Updates many users concurrently, as Client.update_users.  Returns
+        an AsyncBatchReport.
+        """
+        return AsyncBatchReport(self._batch(
+            self.update_user, users,
+            lambda u: (u.userId, (u, partial)), max_workers
+        ))
+
+    def update_developers(self, devs, partial=False, max_workers=None):
+        return AsyncBatchReport(self._batch(
+            self.update_developer, devs,
+            lambda d: (d.developerId, (d, partial)), max_workers
+        ))
+
+    def update_ownerships(self, owns, partial=False, max_workers=None):
+        return AsyncBatchReport(self._batch(
+            self.update_ownership, owns,
+            lambda o: (o.ownershipId, (o, partial)), max_workers
+        ))
+
+    def install_apps(self, installs, max_workers=None):
+
+        def key(item):
+            if len(item) == 2:
+                item = (item[0], item[1], item[1].model[0])
+            return (item[0].userId, item[1].appId), item
+
+        return AsyncBatchReport(self._batch(
+            self.install_app, installs, key, max_workers
+        ))
+
+    async def _iter_list(self, url, cls, limit, max_pages=None):
+
+        page = 1
+        pending = asyncio.ensure_future(
+            self._get("%s&pageNumber=%d&limit=%d" % (url, page, limit))
+        )
+
+        try:
+
+            while pending:
+
+                data = await pending
+                items = data.get("list", [])
+
+                pages = data.get("pages")
+                if pages != None:
+                    more = page < pages
+                else:
+                    more = len(items) >= limit
+                if max_pages != None and page >= max_pages:
+                    more = False
+
+                page += 1
+                if more and len(items) > 0:
+                    pending = asyncio.ensure_future(
+                        self._get("%s&pageNumber=%d&limit=%d" % (
+                            url, page, limit
+                        ))
+                    )
+                else:
+                    pending = None
+
+                for v in items:
+                    yield cls(client=self).parse(v)
+
+                del items, data
+
+        finally:
+            if pending:
+                pending.cancel()
+
+    async def _stream_list(self, url, cls, limit, chunk_size=65536):
+        """
+        Yields objects of type cls from the list array of each page while
+        it is still arriving, as Client._stream_list.
+        """
+
+        page = 1
+
+        while True:
+
+            url_page = "%s&pageNumber=%d&limit=%d" % (url, page, limit)
+            resp = await self._request("GET", url_page, stream=True)
+            count = 0
+            try:
+                stream = ListStream()
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    stream.feed(chunk)
+                    for v in stream.ready():
+                        count += 1
+                        yield cls(client=self).parse(v)
+                stream.feed(b"", final=True)
+                for v in stream.ready():
+                    count += 1
+                    yield cls(client=self).parse(v)
+            finally:
+                resp.release()
+
+            pages = stream.meta.get("pages")
+            if pages != None:
+                more = page < pages
+            else:
+                more = count >= limit
+
+            if not more or count == 0:
+                return
+            page += 1
+
+    async def list_apps(self, query=None):
+
+        if query == None:
+            query = { "status.value": "approved" }
+
+        url = "%s/apps?query=%s&sort=%s&userId=%s" % (
+            self.base, query, {"randomize": 1}, self.userId
+        )
+
+        return [App(client=self).parse(v) for v in (await self._get(url))["list"]]
+
+    def iter_apps(self, query=None, limit=100, sort=None,
+                  max_pages=None):
+
+        if query == None:
+            query = { "status.value": "approved" }
 
-    def list_apps(self, query=None):
+        if sort == None:
+            sort = { "appId": 1 }
+
+        url = "%s/apps?query=%s&sort=%s&userId=%s" % (
+            self.base, query, sort, self.userId
+        )
+
+        return self._iter_list(url, App, limit, max_pages)
+
+    def stream_apps(self, query=None, limit=1000, sort=None):
 
         if query == None:
             query = { "status.value": "approved" }
 
+        if sort == None:
+            sort = { "appId": 1 }
+
         url = "%s/apps?query=%s&sort=%s&userId=%s" % (
-            self.base, query, {"randomize": 1}, self.userId
+            self.base, query, sort, self.userId
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return self._stream_list(url, App, limit)
 
-        return [App(client=self).parse(v) for v in resp.json()["list"]]
-
-    def search_apps(self, text, query=None, fields=None):
+    async def search_apps(self, text, query=None, fields=None):
 
         if query == None:
             query = { "status.value": "approved" }
@@ -346,13 +4799,9 @@ class Client:
             self.base, query, text, fields, self.userId
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return [App(client=self).parse(v) for v in (await self._get(url))["list"]]
 
-        return [App(client=self).parse(v) for v in resp.json()["list"]]
-
-    def list_app_versions(self, query=None):
+    async def list_app_versions(self, query=None):
 
         if query == None:
             query = { "status.value": "approved" }
@@ -361,82 +4810,72 @@ class Client:
             self.base, query, {"randomize": 1}, self.developerId
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return [App(client=self).parse(v) for v in (await self._get(url))["list"]]
 
-        return [App(client=self).parse(v) for v in resp.json()["list"]]
+    def iter_app_versions(self, query=None, limit=100, sort=None,
+                          max_pages=None):
 
-    def delete_app(self, app):
+        if query == None:
+            query = { "status.value": "approved" }
+
+        if sort == None:
+            sort = { "appId": 1, "version": 1 }
+
+        url = "%s/apps/versions?query=%s&sort=%s&developerId=%s" % (
+            self.base, query, sort, self.developerId
+        )
+
+        return self._iter_list(url, App, limit, max_pages)
+
+    async def delete_app(self, app):
 
         url = "%s/apps/%s?developerId=%s" % (
             self.base, app.appId, self.developerId
         )
 
-        resp = self.session.delete(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        await self._delete(url)
 
-    def delete_app_version(self, app, version):
+    async def delete_app_version(self, app, version):
 
         url = "%s/apps/%s/versions/%s?developerId=%s" % (
             self.base, app.appId, version, self.developerId
         )
 
-        resp = self.session.delete(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-
-    def create_app(self, app):
+        await self._delete(url)
 
-        headers = { "Content-Type": "application/json" }
-        request = app.encode()
+    async def create_app(self, app):
 
         url = "%s/apps?developerId=%s" % (
             self.base, self.developerId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return App(client=self).parse(resp.json())
-
-    def update_app(self, app, version):
+        return App(client=self).parse(
+            await self._post(url, self.codec.encode(app))
+        )
 
-        headers = { "Content-Type": "application/json" }
-        request = app.encode()
+    async def update_app(self, app, version, partial=False):
 
         url = "%s/apps/%s/versions/%s?developerId=%s" % (
             self.base, app.appId, version, self.developerId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return App(client=self).parse(resp.json())
+        return App(client=self).parse(
+            await self._post(url, self._body(app, partial), idempotent=True)
+        )
 
-    def publish_app_version(self, app, version, autoApprove=False):
+    async def publish_app_version(self, app, version, autoApprove=False):
 
-        headers = { "Content-Type": "application/json" }
         request = {
             "version": version,
             "developerId": self.developerId,
             "autoApprove": autoApprove
         }
-        
-        url = "%s/apps/%s/publish" % (self.base, app.appId)
 
-        resp = requests.post(url, data=json.dumps(request),
-                             headers=headers, auth=self.auth)
+        url = "%s/apps/%s/publish" % (self.base, app.appId)
 
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        await self._post(url, self.codec.encode(request), idempotent=True)
 
-    def get_app_version(self, id, version):
+    async def get_app_version(self, id, version):
 
         headers = { "Content-Type": "application/json" }
 
@@ -444,14 +4883,9 @@ class Client:
             self.base, id, version, self.developerId
         )
 
-        resp = self.session.get(url, auth=self.auth,
-                                headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return App(client=self).parse(resp.json())
+        return App(client=self).parse(await self._get(url, headers))
 
-    def get_app(self, id):
+    async def get_app(self, id):
 
         headers = { "Content-Type": "application/json" }
 
@@ -459,76 +4893,136 @@ class Client:
             self.base, id, self.userId
         )
 
-        resp = self.session.get(url, auth=self.auth,
-                                headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return App(client=self).parse(resp.json())
+        return App(client=self).parse(await self._get(url, headers))
 
-    def change_live_version(self, app, version, autoApprove=False):
+    async def get_apps(self, ids, max_workers=None):
+        return await self.bulk(self.get_app, ids, max_workers)
+
+    async def change_live_version(self, app, version, autoApprove=False):
 
-        headers = { "Content-Type": "application/json" }
         request = {
             "version": version,
             "developerId": self.developerId
         }
-        
-        url = "%s/apps/%s/live" % (self.base, app.appId)
 
-        resp = requests.post(url, data=json.dumps(request),
-                             headers=headers, auth=self.auth)
+        url = "%s/apps/%s/live" % (self.base, app.appId)
 
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        await self._post(url, self.codec.encode(request), idempotent=True)
 
-    def status_change(self, app, status, reason):
+    async def status_change(self, app, status, reason):
 
-        headers = { "Content-Type": "application/json" }
         request = {
             "status": status,
             "reason": reason,
             "developerId": self.developerId
         }
-        
-        url = "%s/apps/%s/status" % (self.base, app.appId)
 
-        resp = requests.post(url, data=json.dumps(request),
-                             headers=headers, auth=self.auth)
+        url = "%s/apps/%s/status" % (self.base, app.appId)
 
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        await self._post(url, self.codec.encode(request), idempotent=True)
 
-    def upload_file(self, filename, data):
+    async def upload_file(self, filename, data=None, path=None,
+                          progress=None, chunk_size=65536):
+        """
+        Uploads a file, as Client.upload_file.  The body is read afresh
+        for each attempt, so the upload can be retried.
+        """
 
         url = "%s/files" % self.base
 
-        files = { filename: data }
-        resp = requests.post(url, files=files, auth=self.auth)
+        body = MultipartBody(filename, data, path, progress, chunk_size)
+        headers = {
+            "Content-Type": body.content_type,
+            "Content-Length": str(len(body)),
+        }
 
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        try:
+            resp = await self._request("POST", url, data=body,
+                                       headers=headers)
+        finally:
+            body.close()
 
-        return File().parse(resp.json())
+        self.upload_bytes += body.sent
+        if body.started != None:
+            self.upload_seconds += time.monotonic() - body.started
 
-    def upload_url(self, u):
+        return File().parse(self.codec.decode(resp))
+
+    async def upload_files(self, paths, index=None, max_workers=None):
+        """
+        Uploads many files concurrently, as Client.upload_files.  Files are
+        hashed in the event loop's default executor.
+        """
+
+        paths = list(dict.fromkeys(paths))
+        report = UploadReport()
+        loop = asyncio.get_running_loop()
+
+        async def digest(path):
+            return await loop.run_in_executor(None, file_digest, path)
+
+        start = time.monotonic()
+
+        # Group the inputs by content, taking one path per digest.
+        todo = {}
+        for res in await self.bulk(digest, paths, max_workers):
+            if not res.ok():
+                report.errors[res.key] = res.error
+                continue
+            key, size = res.value
+            if key not in todo:
+                todo[key] = (size, [])
+            todo[key][1].append(res.key)
+
+        async def upload(key):
+            size, group = todo[key]
+            file = None
+            if index != None:
+                file = index.get(key)
+            if file != None:
+                return file, False
+            file = await self.upload_file(os.path.basename(group[0]),
+                                          path=group[0])
+            if index != None:
+                index.put(key, file)
+            return file, True
+
+        try:
+            for res in await self.bulk(upload, list(todo), max_workers):
+                size, group = todo[res.key]
+                report.add(group, size, res)
+        finally:
+            if index != None:
+                index.save()
+
+        report.seconds = time.monotonic() - start
+
+        return report
+
+    def upload_stats(self):
+        """
+        Returns the bytes uploaded by upload_file, the time spent, and the
+        resulting rate in bytes/second.
+        """
+        rate = 0.0
+        if self.upload_seconds > 0:
+            rate = self.upload_bytes / self.upload_seconds
+        return {
+            "bytes": self.upload_bytes, "seconds": self.upload_seconds,
+            "rate": rate,
+        }
+
+    async def upload_url(self, u):
 
-        headers = { "Content-Type": "application/json" }
         request = {
             "url": u
         }
-        
-        url = "%s/files/url" % self.base
-
-        resp = requests.post(url, data=json.dumps(request), auth=self.auth,
-                             headers=headers)
 
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        url = "%s/files/url" % self.base
 
-        return File().parse(resp.json())
+        return File().parse(await self._post(url, self.codec.encode(request)))
 
-    def get_app_by_safename(self, safename):
+    async def get_app_by_safename(self, safename):
 
         headers = { "Content-Type": "application/json" }
 
@@ -536,24 +5030,18 @@ class Client:
             self.base, safename, self.userId
         )
 
-        resp = self.session.get(url, auth=self.auth,
-                                headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return App(client=self).parse(resp.json())
+        return App(client=self).parse(await self._get(url, headers))
 
-    def get_developer(self, id):
+    async def get_developer(self, id):
 
         url = "%s/developers/%s" % ( self.base, id )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Developer(client=self).parse(resp.json())
+        return Developer(client=self).parse(await self._get(url))
 
-    def list_developers(self, query=None):
+    async def get_developers(self, ids, max_workers=None):
+        return await self.bulk(self.get_developer, ids, max_workers)
+
+    async def list_developers(self, query=None):
 
         if query == None:
             query = {}
@@ -562,65 +5050,62 @@ class Client:
             self.base, query, {"name": 1}
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return [
+            Developer(client=self).parse(v)
+            for v in (await self._get(url))["list"]
+        ]
+
+    def iter_developers(self, query=None, limit=100, sort=None,
+                        max_pages=None):
 
-        return [Developer(client=self).parse(v) for v in resp.json()["list"]]
+        if query == None:
+            query = {}
 
-    def update_developer(self, dev):
+        if sort == None:
+            sort = { "name": 1, "developerId": 1 }
 
-        headers = { "Content-Type": "application/json" }
-        request = dev.encode()
+        url = "%s/developers?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, Developer, limit, max_pages)
+
+    async def update_developer(self, dev, partial=False):
 
         url = "%s/developers/%s" % (
             self.base, dev.developerId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Developer(client=self).parse(resp.json())
+        return Developer(client=self).parse(
+            await self._post(url, self._body(dev, partial), idempotent=True)
+        )
 
-    def get_developer_group(self, id):
+    async def get_developer_group(self, id):
 
         url = "%s/developers/groups/%s" % ( self.base, id )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return DeveloperGroup(client=self).parse(resp.json())
-
-    def update_developer_group(self, group):
+        return DeveloperGroup(client=self).parse(await self._get(url))
 
-        headers = { "Content-Type": "application/json" }
-        request = group.encode()
+    async def update_developer_group(self, group):
 
         url = "%s/developers/groups/%s" % (
             self.base, group.groupId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return DeveloperGroup(client=self).parse(resp.json())
+        return DeveloperGroup(client=self).parse(
+            await self._post(url, self.codec.encode(group), idempotent=True)
+        )
 
-    def get_user(self, id):
+    async def get_user(self, id):
 
         url = "%s/users/%s" % ( self.base, id )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return User(client=self).parse(resp.json())
+        return User(client=self).parse(await self._get(url))
 
-    def list_users(self, query=None):
+    async def get_users(self, ids, max_workers=None):
+        return await self.bulk(self.get_user, ids, max_workers)
+
+    async def list_users(self, query=None):
 
         if query == None:
             query = {}
@@ -629,55 +5114,51 @@ class Client:
             self.base, query, {"name": 1}
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return [User(client=self).parse(v) for v in (await self._get(url))["list"]]
 
-        return [User(client=self).parse(v) for v in resp.json()["list"]]
+    def iter_users(self, query=None, limit=100, sort=None,
+                   max_pages=None):
 
-    def update_user(self, user):
+        if query == None:
+            query = {}
 
-        headers = { "Content-Type": "application/json" }
-        request = user.encode()
+        if sort == None:
+            sort = { "name": 1, "userId": 1 }
+
+        url = "%s/users?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, User, limit, max_pages)
+
+    async def update_user(self, user, partial=False):
 
         url = "%s/users/%s" % (
             self.base, user.userId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return User(client=self).parse(resp.json())
+        return User(client=self).parse(
+            await self._post(url, self._body(user, partial), idempotent=True)
+        )
 
-    def get_user_group(self, id):
+    async def get_user_group(self, id):
 
         url = "%s/users/groups/%s" % ( self.base, id )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return UserGroup(client=self).parse(resp.json())
-
-    def update_user_group(self, group):
+        return UserGroup(client=self).parse(await self._get(url))
 
-        headers = { "Content-Type": "application/json" }
-        request = group.encode()
+    async def update_user_group(self, group):
 
         url = "%s/users/groups/%s" % (
             self.base, group.groupId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return UserGroup(client=self).parse(resp.json())
-    
-    def get_stats_total(self, start=None, end=None, query=None, fields=None):
+        return UserGroup(client=self).parse(
+            await self._post(url, self.codec.encode(group), idempotent=True)
+        )
+
+    async def get_stats_total(self, start=None, end=None, query=None,
+                              fields=None):
 
         if query == None:
             query = {}
@@ -695,13 +5176,10 @@ class Client:
             self.base, query, start, end, fields
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return Stats().parse(await self._get(url))
 
-        return Stats().parse(resp.json())
-
-    def get_stats_series(self, start=None, end=None, query=None, field=None):
+    async def get_stats_series(self, start=None, end=None, query=None,
+                               field=None, period="day"):
 
         if query == None:
             query = {}
@@ -714,18 +5192,114 @@ class Client:
             field = "downloads"
 
         url = "%s/stats/series/%s/%s?query=%s&start=%d&end=%d" % (
-            self.base, "day", field, query, start, end
+            self.base, period, field, query, start, end
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return await self._get(url)
 
-        return resp.json()
+    async def _stats_chunks(self, fetch, plan, parts, max_workers=None):
 
-    def install_app(self, user, app, model):
+        cache = self.stats_cache
+        keys = {}
+        results = {}
+
+        for a, b in plan:
+            if cache != None and cache.final(b):
+                keys[(a, b)] = cache.key(self.auth.login, self.base, a, b,
+                                         *parts)
+                value = cache.get(keys[(a, b)])
+                if value != None:
+                    results[(a, b)] = value
+
+        async def call(c):
+            return await fetch(*c)
+
+        missing = [c for c in plan if c not in results]
+        for res in await self.bulk(call, missing, max_workers):
+            if res.error != None:
+                raise res.error
+            results[res.key] = res.value
+            if res.key in keys:
+                cache.put(keys[res.key], res.value)
+
+        return [results[c] for c in plan]
+
+    async def get_stats_series_range(self, start, end, query=None,
+                                     field=None, period="day", chunk=None,
+                                     max_workers=None):
+
+        if query == None:
+            query = {}
+
+        if field == None:
+            field = "downloads"
+
+        plan = RangePlanner(period, chunk).plan(start, end)
+
+        async def fetch(a, b):
+            return await self.get_stats_series(a, b, query, field, period)
+
+        return merge_series(await self._stats_chunks(
+            fetch, plan, ("series", query, field, period), max_workers
+        ))
+
+    async def get_stats_total_range(self, start, end, query=None,
+                                    fields=None, period="day", chunk=None,
+                                    max_workers=None):
+
+        if query == None:
+            query = {}
+
+        if fields == None:
+            fields = [
+                "views", "downloads"
+            ]
+
+        plan = RangePlanner(period, chunk).plan(start, end)
+
+        async def fetch(a, b):
+            return plain(await self.get_stats_total(a, b, query, fields))
+
+        parts = await self._stats_chunks(
+            fetch, plan, ("total", query, fields), max_workers
+        )
+
+        return Stats().parse(functools.reduce(merge_totals, parts, {}))
+
+    async def get_stats_columns(self, start=None, end=None, fields=None,
+                                apps=None, query=None, period="day",
+                                max_workers=None):
+
+        if query == None:
+            query = {}
+
+        if start == None: start = int(time.time() - 86400) * 1000
+        if end == None: end = int(time.time()) * 1000
+
+        if fields == None:
+            fields = [ "downloads" ]
+
+        if apps == None:
+            apps = [None]
+
+        async def fetch(key):
+            app, field = key
+            q = dict(query)
+            if app != None:
+                q["appId"] = app
+            return await self.get_stats_series(start, end, q, field, period)
+
+        series = StatsSeries(period)
+        keys = [(app, field) for app in apps for field in fields]
+        for res in await self.bulk(fetch, keys, max_workers):
+            if res.error != None:
+                raise res.error
+            series.add(res.key[0], res.key[1], res.value)
+
+        return series
+
+    async def install_app(self, user, app, model):
 
-        headers = { "Content-Type": "application/json" }
         request = {
             "appId": app.appId,
             "userId": user.userId,
@@ -736,24 +5310,20 @@ class Client:
             self.base
         )
 
-        resp = self.session.post(url, data=json.dumps(request), auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Ownership(client=self).parse(resp.json())
+        return Ownership(client=self).parse(
+            await self._post(url, self.codec.encode(request))
+        )
 
-    def get_ownership(self, id):
+    async def get_ownership(self, id):
 
         url = "%s/ownership/%s" % ( self.base, id )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Ownership(client=self).parse(resp.json())
+        return Ownership(client=self).parse(await self._get(url))
 
-    def list_ownership(self, query=None):
+    async def get_ownerships(self, ids, max_workers=None):
+        return await self.bulk(self.get_ownership, ids, max_workers)
+
+    async def list_ownership(self, query=None):
 
         if query == None:
             query = {}
@@ -762,15 +5332,42 @@ class Client:
             self.base, query, {"date": 1}
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return [
+            Ownership(client=self).parse(v)
+            for v in (await self._get(url))["list"]
+        ]
 
-        return [Ownership(client=self).parse(v) for v in resp.json()["list"]]
+    def iter_ownership(self, query=None, limit=100, sort=None,
+                       max_pages=None):
 
-    def uninstall_app(self, own):
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": 1, "ownershipId": 1 }
+
+        url = "%s/ownership?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, Ownership, limit, max_pages)
+
+    def stream_ownership(self, query=None, limit=1000, sort=None):
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": 1, "ownershipId": 1 }
+
+        url = "%s/ownership?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._stream_list(url, Ownership, limit)
+
+    async def uninstall_app(self, own):
 
-        headers = { "Content-Type": "application/json" }
         request = {
             "userId": own.userId
         }
@@ -779,84 +5376,55 @@ class Client:
             self.base, own.ownershipId
         )
 
-        resp = self.session.post(url, data=json.dumps(request), auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        await self._post(url, self.codec.encode(request))
 
-    def update_ownership(self, own):
-
-        headers = { "Content-Type": "application/json" }
-        request = own.encode()
+    async def update_ownership(self, own, partial=False):
 
         url = "%s/ownership/%s" % (
             self.base, own.ownershipId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-
-        return Ownership(client=self).parse(resp.json())
-
-    def create_review(self, review):
+        return Ownership(client=self).parse(
+            await self._post(url, self._body(own, partial), idempotent=True)
+        )
 
-        headers = { "Content-Type": "application/json" }
-        request = review.encode()
+    async def create_review(self, review):
 
         url = "%s/reviews" % (
             self.base
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Review(client=self).parse(resp.json())
-
-    def update_review(self, review):
+        return Review(client=self).parse(
+            await self._post(url, self.codec.encode(review))
+        )
 
-        headers = { "Content-Type": "application/json" }
-        request = review.encode()
+    async def update_review(self, review, partial=False):
 
         url = "%s/reviews/%s" % (
             self.base, review.reviewId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Review(client=self).parse(resp.json())
+        return Review(client=self).parse(
+            await self._post(url, self._body(review, partial), idempotent=True)
+        )
 
-    def get_review(self, id):
+    async def get_review(self, id):
 
         url = "%s/reviews/%s" % (
             self.base, id
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Review(client=self).parse(resp.json())
+        return Review(client=self).parse(await self._get(url))
 
-    def get_review_by_app_user(self, app, user):
+    async def get_review_by_app_user(self, app, user):
 
         url = "%s/reviews/apps/%s/users/%s" % (
             self.base, app.appId, user.userId
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Review(client=self).parse(resp.json())
+        return Review(client=self).parse(await self._get(url))
 
-    def list_reviews(self, query=None):
+    async def list_reviews(self, query=None):
 
         if query == None:
             query = {}
@@ -865,63 +5433,61 @@ class Client:
             self.base, query, {"date": 1}, self.userId
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return [
+            Review(client=self).parse(v)
+            for v in (await self._get(url))["list"]
+        ]
 
-        return [Review(client=self).parse(v) for v in resp.json()["list"]]
+    def iter_reviews(self, query=None, limit=100, sort=None,
+                     max_pages=None):
 
-    def get_market(self):
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": 1, "reviewId": 1 }
+
+        url = "%s/reviews?query=%s&sort=%s&userId=%s" % (
+            self.base, query, sort, self.userId
+        )
+
+        return self._iter_list(url, Review, limit, max_pages)
+
+    async def get_market(self):
 
         url = "%s/markets/this" % (
             self.base
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Market(client=self).parse(resp.json())
-
-    def add_permission(self, app, perm):
+        return Market(client=self).parse(await self._get(url))
 
-        headers = { "Content-Type": "application/json" }
-        request = perm.encode()
+    async def add_permission(self, app, perm):
 
         url = "%s/permission/apps/%s" % (
             self.base, app.appId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Permission(client=self).parse(resp.json())
+        return Permission(client=self).parse(
+            await self._post(url, self.codec.encode(perm), idempotent=True)
+        )
 
-    def get_permission(self, app, user):
+    async def get_permission(self, app, user):
 
         url = "%s/permission/apps/%s?userId=%s" % (
             self.base, app.appId, user.userId
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Permission(client=self).parse(resp.json())
+        return Permission(client=self).parse(await self._get(url))
 
-    def delete_permission(self, app, user):
+    async def delete_permission(self, app, user):
 
         url = "%s/permission/apps/%s?userId=%s" % (
             self.base, app.appId, user.userId
         )
 
-        resp = self.session.delete(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        await self._delete(url)
 
-    def list_transactions(self, query=None):
+    async def list_transactions(self, query=None):
 
         if query == None:
             query = {}
@@ -930,76 +5496,83 @@ class Client:
             self.base, query, {"date": -1}
         )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        return [
+            Transaction(client=self).parse(v)
+            for v in (await self._get(url))["list"]
+        ]
+
+    def iter_transactions(self, query=None, limit=100, sort=None,
+                          max_pages=None):
+
+        if query == None:
+            query = {}
+
+        if sort == None:
+            sort = { "date": -1, "transactionId": 1 }
+
+        url = "%s/transactions?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._iter_list(url, Transaction, limit, max_pages)
 
-        return [Transaction(client=self).parse(v) for v in resp.json()["list"]]
+    def stream_transactions(self, query=None, limit=1000, sort=None):
 
-    def update_transaction(self, trans):
+        if query == None:
+            query = {}
 
-        headers = { "Content-Type": "application/json" }
-        request = trans.encode()
+        if sort == None:
+            sort = { "date": -1, "transactionId": 1 }
+
+        url = "%s/transactions?query=%s&sort=%s" % (
+            self.base, query, sort
+        )
+
+        return self._stream_list(url, Transaction, limit)
+
+    async def update_transaction(self, trans, partial=False):
 
         url = "%s/transactions/%s" % (
             self.base, trans.transactionId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Transaction(client=self).parse(resp.json())
-
-    def custom_gateway_add_payment(self, own, trans):
+        return Transaction(client=self).parse(
+            await self._post(url, self._body(trans, partial), idempotent=True)
+        )
 
-        headers = { "Content-Type": "application/json" }
-        request = trans.encode()
+    async def custom_gateway_add_payment(self, own, trans):
 
         url = "%s/custom-gateway/payment/%s" % (
             self.base, own.ownershipId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Transaction(client=self).parse(resp.json())
-
-    def custom_gateway_add_refund(self, own, trans):
+        return Transaction(client=self).parse(
+            await self._post(url, self.codec.encode(trans))
+        )
 
-        headers = { "Content-Type": "application/json" }
-        request = trans.encode()
+    async def custom_gateway_add_refund(self, own, trans):
 
         url = "%s/custom-gateway/refund/%s" % (
             self.base, own.ownershipId
         )
 
-        resp = self.session.post(url, data=request, auth=self.auth,
-                                 headers=headers)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Transaction(client=self).parse(resp.json())
+        return Transaction(client=self).parse(
+            await self._post(url, self.codec.encode(trans))
+        )
 
-    def get_transaction(self, id):
+    async def get_transaction(self, id):
 
         url = "%s/transactions/%s" % ( self.base, id )
 
-        resp = self.session.get(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
-        
-        return Transaction(client=self).parse(resp.json())
+        return Transaction(client=self).parse(await self._get(url))
 
-    def delete_transaction(self, trans):
+    async def get_transactions(self, ids, max_workers=None):
+        return await self.bulk(self.get_transaction, ids, max_workers)
+
+    async def delete_transaction(self, trans):
 
         url = "%s/transactions/%s" % (
             self.base, trans.transactionId
         )
 
-        resp = self.session.delete(url, auth=self.auth)
-        if resp.status_code != 200:
-            raise ApiError(resp.status_code, resp.text)
+        await self._delete(url)
@@ -0,0 +1,319 @@
+"""
+AsyncClient against the benchmarks' mock server.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+import http.server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "benchmarks"))
+
+import openchannel as oc
+
+from mockserver import MockServer
+
+class FlakyUploads:
+    """
+    Answers the first POST to /files with 429, then echoes the size of
+    each upload's body.
+    """
+
+    def __init__(self):
+        self.sizes = []
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), self.handler()
+        )
+        self.server.daemon_threads = True
+        threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        ).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/v2" % self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler(self):
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                server.sizes.append(len(self.rfile.read(length)))
+                if len(server.sizes) == 1:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps({
+                    "fileId": "f1", "size": server.sizes[-1],
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+class SlowList:
+    """
+    Sends a list of rows transactions a row at a time, pause seconds
+    apart.
+    """
+
+    def __init__(self, rows, pause):
+        self.rows = rows
+        self.pause = pause
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), self.handler()
+        )
+        self.server.daemon_threads = True
+        threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        ).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/v2" % self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler(self):
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                rows = [
+                    json.dumps({ "transactionId": "t%d" % i })
+                    for i in range(server.rows)
+                ]
+                parts = ['{"pages": 1, "list": [' + rows[0]]
+                parts += ["," + row for row in rows[1:]]
+                parts.append("]}")
+                parts = [part.encode("utf-8") for part in parts]
+                self.send_response(200)
+                self.send_header("Content-Length",
+                                 str(sum(len(p) for p in parts)))
+                self.end_headers()
+                for part in parts:
+                    self.wfile.write(part)
+                    self.wfile.flush()
+                    time.sleep(server.pause)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+@unittest.skipIf(oc.aiohttp == None, "needs aiohttp")
+class AsyncClientTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = MockServer(items=50, payload=100).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def client(self, **kwargs):
+        cli = oc.AsyncClient("marketplace", "secret", **kwargs)
+        cli.base = self.server.url
+        return cli
+
+    async def test_get(self):
+        async with self.client() as cli:
+            app = await cli.get_app("%018d" % 7)
+            self.assertIsInstance(app, oc.App)
+            self.assertEqual(app.appId, "5b2c7d%018d" % 7)
+            self.assertEqual((await cli.get_user("3")).userId, "3")
+
+    async def test_bulk(self):
+        async with self.client() as cli:
+            results = await cli.get_users([str(i) for i in range(20)] + ["0"])
+            self.assertEqual(len(results), 20)
+            self.assertTrue(all(r.ok() for r in results))
+            self.assertEqual(results[5].value.userId, "5")
+
+    async def test_iter(self):
+        async with self.client() as cli:
+            ids = [v.userId async for v in cli.iter_users(limit=7)]
+            self.assertEqual(ids, [str(i) for i in range(50)])
+
+    async def test_stream(self):
+        # More than one page, which a single request would cut short.
+        self.server.items = 250
+        async with self.client() as cli:
+            paged = [v async for v in cli.iter_transactions(limit=100)]
+            streamed = [v async for v in cli.stream_transactions(limit=100)]
+            self.assertEqual(len(streamed), 250)
+            self.assertEqual([v.fields() for v in streamed],
+                             [v.fields() for v in paged])
+
+    async def test_coalesce(self):
+        async with self.client() as cli:
+            self.server.latency = 0.05
+            before = self.server.stats()["requests"]
+            apps = await asyncio.gather(*[cli.get_app("1") for i in range(5)])
+            self.assertEqual(self.server.stats()["requests"] - before, 1)
+            self.assertEqual(cli.coalesce_stats()["coalesced"], 4)
+            # Each caller has its own copy.
+            apps[0].name = "Changed"
+            self.assertNotEqual(apps[1].name, "Changed")
+
+    async def test_coalesce_cancel(self):
+        async with self.client() as cli:
+            self.server.latency = 0.1
+            leader = asyncio.ensure_future(cli.get_app("2"))
+            await asyncio.sleep(0.02)
+            waiter = asyncio.ensure_future(cli.get_app("2"))
+            await asyncio.sleep(0.02)
+            leader.cancel()
+            self.assertEqual((await waiter).appId, "5b2c7d%018d" % 2)
+            self.assertTrue(leader.cancelled())
+
+    async def test_retry(self):
+        self.server.error_rate = 0.3
+        policy = oc.RetryPolicy(max_attempts=20, backoff=0.001)
+        async with self.client(retry=policy) as cli:
+            results = await cli.get_apps(["%018d" % i for i in range(30)])
+            self.assertTrue(all(r.ok() for r in results))
+            self.assertGreater(cli.retry_stats()["retries"], 0)
+
+    async def test_update_users(self):
+
+        async with self.client() as cli:
+
+            def users():
+                for i in range(25):
+                    u = oc.User(client=cli).parse({ "userId": str(i) })
+                    u.name = "Renamed %d" % i
+                    yield u
+
+            report = cli.update_users(users(), partial=True, max_workers=4)
+            keys = []
+            async for res in report:
+                self.assertTrue(res.ok())
+                self.assertEqual(res.value.name, "Renamed %s" % res.key)
+                keys.append(res.key)
+            self.assertEqual(keys, [str(i) for i in range(25)])
+            self.assertEqual((report.count, report.failed), (25, 0))
+
+    async def test_bad_item(self):
+        async with self.client() as cli:
+            users = [oc.User(client=cli).parse({ "userId": str(i) })
+                     for i in range(6)]
+            bad = oc.User(client=cli).parse({ "name": "Nobody" })
+            users.insert(3, bad)
+            report = await cli.update_users(users, max_workers=2).run()
+            self.assertEqual((report.count, report.failed), (7, 1))
+            results = [res async for res in cli.update_users(users)]
+            self.assertIs(results[3].key, bad)
+            self.assertIsInstance(results[3].error, AttributeError)
+
+    async def test_install_apps(self):
+        async with self.client() as cli:
+            user = oc.User(client=cli).parse({ "userId": "9" })
+            apps = await cli.list_apps()
+            report = await cli.install_apps(
+                [(user, app) for app in apps[:3]]
+            ).run()
+            self.assertEqual((report.count, report.failed), (3, 0))
+
+    async def test_upload(self):
+        sent = []
+        async with self.client() as cli:
+            file = await cli.upload_file(
+                "a.bin", b"x" * 200000, chunk_size=65536,
+                progress=lambda done, total, elapsed: sent.append(done)
+            )
+            self.assertGreater(file.size, 200000)
+            self.assertEqual(sent[-1], file.size)
+            self.assertEqual(cli.upload_stats()["bytes"], file.size)
+
+    async def test_upload_retry(self):
+        server = FlakyUploads()
+        try:
+            cli = oc.AsyncClient("marketplace", "secret",
+                                 retry=oc.RetryPolicy(backoff=0.001))
+            cli.base = server.url
+            async with cli:
+                file = await cli.upload_file("a.bin", b"x" * 100000)
+            # The whole body went again.
+            self.assertEqual(server.sizes, [file.size, file.size])
+            self.assertEqual(cli.retry_stats()["retries"], 1)
+        finally:
+            server.stop()
+
+    async def test_upload_files(self):
+        folder = tempfile.mkdtemp()
+        paths = []
+        for i, content in enumerate([b"one", b"two", b"one"]):
+            paths.append(os.path.join(folder, "f%d" % i))
+            with open(paths[-1], "wb") as f:
+                f.write(content)
+        index = oc.UploadIndex(os.path.join(folder, "index.json"))
+        async with self.client() as cli:
+            report = await cli.upload_files(paths, index)
+            self.assertEqual((report.uploaded, report.skipped), (2, 0))
+            self.assertEqual(len(report.files), 3)
+            report = await cli.upload_files(paths, index)
+            self.assertEqual((report.uploaded, report.skipped), (0, 2))
+
+    async def test_timeout(self):
+        # Reads come every 0.1s, so the stream outlasts the timeout without
+        # ever waiting that long on one.
+        server = SlowList(10, 0.1)
+        try:
+            cli = oc.AsyncClient("marketplace", "secret", timeout=0.5)
+            cli.base = server.url
+            async with cli:
+                rows = [v async for v in cli.stream_transactions()]
+            self.assertEqual(len(rows), 10)
+        finally:
+            server.stop()
+
+    async def test_read_timeout(self):
+        server = SlowList(3, 1.0)
+        try:
+            cli = oc.AsyncClient("marketplace", "secret", timeout=(5, 0.3))
+            cli.base = server.url
+            async with cli:
+                with self.assertRaises(asyncio.TimeoutError):
+                    [v async for v in cli.stream_transactions()]
+        finally:
+            server.stop()
+
+    async def test_metrics(self):
+        async with self.client(metrics=oc.Metrics()) as cli:
+            await cli.get_app("1")
+            await cli.list_apps()
+            endpoints = cli.stats()["endpoints"]
+            self.assertEqual(endpoints["GET /apps/{id}"]["requests"], 1)
+            self.assertEqual(endpoints["GET /apps"]["errors"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
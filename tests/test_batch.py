@@ -0,0 +1,69 @@
+"""
+Client's batch mutations against the benchmarks' mock server.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "benchmarks"))
+
+import openchannel as oc
+
+from mockserver import MockServer
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer(items=20, payload=10).start()
+        self.cli = oc.Client("marketplace", "secret", max_workers=3)
+        self.cli.base = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def users(self, count):
+        for i in range(count):
+            u = oc.User(client=self.cli).parse({ "userId": str(i) })
+            u.name = "Renamed %d" % i
+            yield u
+
+    def test_update_users(self):
+        report = self.cli.update_users(self.users(10), partial=True)
+        results = list(report)
+        self.assertEqual([r.key for r in results], [str(i) for i in range(10)])
+        self.assertTrue(all(r.ok() for r in results))
+        self.assertEqual(results[3].value.name, "Renamed 3")
+        self.assertEqual((report.count, report.failed), (10, 0))
+
+    def test_bad_item(self):
+        # A user with no userId fails alone, in its place.
+        users = list(self.users(9))
+        bad = oc.User(client=self.cli).parse({ "name": "Nobody" })
+        users.insert(4, bad)
+        report = self.cli.update_users(users)
+        results = list(report)
+        self.assertEqual(len(results), 10)
+        self.assertIs(results[4].key, bad)
+        self.assertIsInstance(results[4].error, AttributeError)
+        self.assertTrue(all(r.ok() for i, r in enumerate(results) if i != 4))
+        self.assertEqual((report.count, report.failed), (10, 1))
+
+    def test_install_apps(self):
+        user = oc.User(client=self.cli).parse({ "userId": "9" })
+        apps = self.cli.list_apps()[:5]
+        # An app with no model can't be installed without naming one.
+        bare = oc.App(client=self.cli).parse({ "appId": "bare" })
+        installs = [(user, app) for app in apps]
+        installs.insert(2, (user, bare))
+        results = list(self.cli.install_apps(installs))
+        self.assertEqual(len(results), 6)
+        self.assertFalse(results[2].ok())
+        self.assertEqual([r.key for i, r in enumerate(results) if i != 2],
+                         [("9", app.appId) for app in apps])
+        self.assertTrue(all(r.ok() for i, r in enumerate(results) if i != 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Exporter against the benchmarks' mock server, whose lists ignore the
+query, so each partition gets every row, over several pages.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "benchmarks"))
+
+import openchannel as oc
+
+from mockserver import MockServer
+
+DAY = 86400000
+START = 1700006400000 // DAY * DAY
+
+class Interrupted(Exception):
+    pass
+
+class FlakyClient(oc.Client):
+    """
+    Client whose stream_transactions breaks off partway through the
+    partitions starting at a time in fail.
+    """
+
+    fail = set()
+
+    def stream_transactions(self, query=None, limit=1000, sort=None):
+        objs = super().stream_transactions(query, limit, sort)
+        if query["date"]["$gte"] not in self.fail:
+            return objs
+
+        def broken():
+            for i, obj in enumerate(objs):
+                if i == 150:
+                    raise Interrupted()
+                yield obj
+
+        return broken()
+
+class ExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer(items=250, payload=10).start()
+        self.path = tempfile.mkdtemp()
+        self.cli = FlakyClient("marketplace", "secret", max_workers=2)
+        self.cli.base = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.path)
+
+    def exporter(self):
+        return oc.Exporter(self.cli, self.path, limit=100)
+
+    def rows(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return [json.loads(line) for line in f]
+
+    def test_pages(self):
+        report = self.exporter().export(START, START + 2 * DAY)
+        self.assertEqual(report.errors, {})
+        self.assertEqual((report.partitions, report.rows), (2, 500))
+        rows = self.rows(os.path.basename(report.files[0]))
+        self.assertEqual(len(rows), 250)
+        self.assertEqual(len(set(r["transactionId"] for r in rows)), 250)
+        with open(os.path.join(self.path, "checkpoint.json")) as f:
+            checkpoint = json.load(f)
+        self.assertEqual([e["rows"] for e in checkpoint.values()], [250, 250])
+
+    def test_resume(self):
+
+        self.cli.fail = { START + DAY }
+        report = self.exporter().export(START, START + 3 * DAY)
+        self.assertEqual(list(report.errors), ["transactions-2023-11-16"])
+        self.assertIsInstance(report.errors["transactions-2023-11-16"],
+                              Interrupted)
+        self.assertEqual(report.partitions, 2)
+        # Nothing is left of the broken partition.
+        self.assertEqual(sorted(os.listdir(self.path)), [
+            "checkpoint.json", "transactions-2023-11-15.ndjson",
+            "transactions-2023-11-17.ndjson",
+        ])
+
+        self.cli.fail = set()
+        before = self.server.stats()["requests"]
+        report = self.exporter().export(START, START + 3 * DAY)
+        self.assertEqual(report.errors, {})
+        self.assertEqual((report.skipped, report.partitions), (2, 1))
+        self.assertEqual(report.rows, 250)
+        # Three pages, for the one partition left.
+        self.assertEqual(self.server.stats()["requests"] - before, 3)
+        self.assertEqual(len(self.rows("transactions-2023-11-16.ndjson")),
+                         250)
+
+if __name__ == "__main__":
+    unittest.main()
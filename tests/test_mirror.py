@@ -0,0 +1,145 @@
+"""
+Mirror and AppIndex syncing from a client whose records change between
+the pages of a sync.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openchannel as oc
+
+class LiveClient(oc.Client):
+    """
+    Serves iter_users and iter_apps from records held in memory, paged by
+    pageNumber over the query's current results, as the API does.
+    on_page, if set, is called with the number of pages served so far,
+    after each page is taken.
+    """
+
+    def __init__(self):
+        super().__init__("marketplace", "secret")
+        self.records = { "users": {}, "apps": {} }
+        self.pages = 0
+        self.on_page = None
+
+    def _list(self, kind, cls, query, limit, sort, max_pages):
+
+        def match(record):
+            for name, cond in query.items():
+                value = record.get(name)
+                if isinstance(cond, dict):
+                    if value == None or value < cond["$gte"]:
+                        return False
+                elif value != cond:
+                    return False
+            return True
+
+        page = 0
+        while max_pages == None or page < max_pages:
+            rows = [r for r in self.records[kind].values() if match(r)]
+            rows.sort(key=lambda r: [r.get(name) for name in sort])
+            rows = rows[page * limit:(page + 1) * limit]
+            self.pages += 1
+            if self.on_page != None:
+                self.on_page(self.pages)
+            for r in rows:
+                yield cls(client=self).parse(dict(r))
+            if len(rows) < limit:
+                return
+            page += 1
+
+    def iter_users(self, query=None, limit=100, sort=None, max_pages=None):
+        return self._list("users", oc.User, query or {}, limit, sort,
+                          max_pages)
+
+    def iter_apps(self, query=None, limit=100, sort=None, max_pages=None):
+        return self._list("apps", oc.App, query or {}, limit, sort,
+                          max_pages)
+
+    def put(self, kind, id, modified, **members):
+        member = { "users": "userId", "apps": "appId" }[kind]
+        self.records[kind][id] = dict(
+            { member: id, "lastUpdated": modified }, **members
+        )
+
+class MirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cli = LiveClient()
+        for i in range(250):
+            self.cli.put("users", "u%03d" % i, 1000 + i, name="User %d" % i)
+        self.mirror = oc.Mirror(self.cli,
+                                os.path.join(self.folder, "mirror.db"))
+
+    def tearDown(self):
+        self.mirror.close()
+        shutil.rmtree(self.folder)
+
+    def ids(self):
+        return sorted(u.userId for u in self.mirror.users())
+
+    def test_modified_during_sync(self):
+
+        # After the first page, an early user is modified, which moves it
+        # to the end and shifts everyone after it down a place.
+        def modify(pages):
+            if pages == 1:
+                self.cli.put("users", "u005", 5000, name="Changed")
+
+        self.cli.on_page = modify
+        self.mirror.sync(["users"])
+        self.assertEqual(self.ids(), ["u%03d" % i for i in range(250)])
+        self.assertEqual(self.mirror.get_user("u005").name, "Changed")
+
+    def test_incremental(self):
+        self.mirror.sync(["users"])
+        self.cli.put("users", "u300", 2000, name="New")
+        self.cli.put("users", "u007", 2000, name="Changed")
+        report = self.mirror.sync(["users"])
+        # The latest user is fetched again, along with the two new ones.
+        self.assertEqual(report["users"]["records"], 3)
+        self.assertEqual(len(self.ids()), 251)
+        self.assertEqual(self.mirror.get_user("u007").name, "Changed")
+
+    def test_ties(self):
+        # More users modified in one millisecond than fit on a page.
+        for i in range(250):
+            self.cli.put("users", "u%03d" % i, 1000)
+        self.mirror.sync(["users"])
+        self.assertEqual(len(self.ids()), 250)
+
+class AppIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cli = LiveClient()
+        for i in range(250):
+            self.cli.put("apps", "a%03d" % i, 1000 + i, name="App %d" % i)
+        self.index = oc.AppIndex()
+
+    def test_modified_during_refresh(self):
+
+        def modify(pages):
+            if pages == 1:
+                self.cli.put("apps", "a005", 5000, name="Changed")
+
+        self.cli.on_page = modify
+        self.index.refresh(self.cli)
+        self.assertEqual(len(self.index), 250)
+        self.assertEqual(self.index.get("a005").name, "Changed")
+        self.assertEqual(self.index.latest, 5000)
+
+    def test_incremental(self):
+        self.index.refresh(self.cli)
+        self.cli.put("apps", "a300", 2000, name="New Thing")
+        self.assertEqual(self.index.refresh(self.cli), 2)
+        self.assertEqual([a.appId for a in self.index.search("thing")],
+                         ["a300"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+RangePlanner chunking, and merging the chunks' series and totals.
+"""
+
+import os
+import sys
+import unittest
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openchannel as oc
+
+HOUR = 3600000
+DAY = 86400000
+
+def ms(*args):
+    d = datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+    return int(d.timestamp()) * 1000
+
+class RangePlannerTest(unittest.TestCase):
+
+    def test_days(self):
+        planner = oc.RangePlanner("day", 10)
+        start = 25 * DAY + 5 * HOUR
+        plan = planner.plan(start, 47 * DAY)
+        self.assertEqual(plan, [
+            (start, 30 * DAY), (30 * DAY, 40 * DAY), (40 * DAY, 47 * DAY),
+        ])
+
+    def test_aligned(self):
+        # The same historical chunks come up whatever the window.
+        planner = oc.RangePlanner("hour", 24)
+        a = planner.plan(3 * HOUR, 5 * DAY)
+        b = planner.plan(DAY + 7 * HOUR, 6 * DAY)
+        self.assertEqual(a[2:4], b[1:3])
+        self.assertEqual(a[2:4], [(2 * DAY, 3 * DAY), (3 * DAY, 4 * DAY)])
+        self.assertTrue(all(x % DAY == 0 for x, y in a[1:] + b[1:]))
+
+    def test_contiguous(self):
+        for period, chunk in [("hour", 5), ("day", 7), ("month", 2)]:
+            start, end = ms(2023, 1, 30, 17), ms(2023, 7, 2)
+            plan = oc.RangePlanner(period, chunk).plan(start, end)
+            self.assertEqual(plan[0][0], start)
+            self.assertEqual(plan[-1][1], end)
+            for (a, b), (c, d) in zip(plan, plan[1:]):
+                self.assertEqual(b, c)
+            self.assertTrue(all(a < b for a, b in plan))
+
+    def test_months(self):
+        plan = oc.RangePlanner("month", 3).plan(ms(2023, 2, 15), ms(2023, 9, 1))
+        self.assertEqual(plan, [
+            (ms(2023, 2, 15), ms(2023, 4, 1)),
+            (ms(2023, 4, 1), ms(2023, 7, 1)),
+            (ms(2023, 7, 1), ms(2023, 9, 1)),
+        ])
+
+    def test_edges(self):
+        planner = oc.RangePlanner("day")
+        self.assertEqual(planner.plan(DAY, DAY), [])
+        self.assertEqual(planner.plan(2 * DAY, DAY), [])
+        # Ending on a chunk boundary gives no empty chunk after it.
+        self.assertEqual(oc.RangePlanner("day", 1).plan(0, 2 * DAY),
+                         [(0, DAY), (DAY, 2 * DAY)])
+        with self.assertRaises(ValueError):
+            oc.RangePlanner("week")
+
+class MergeTest(unittest.TestCase):
+
+    def test_series(self):
+        parts = [
+            [[0, 1], [DAY, 2]],
+            [[2 * DAY, 3], [3 * DAY, 4]],
+        ]
+        self.assertEqual(oc.merge_series(parts),
+                         [[0, 1], [DAY, 2], [2 * DAY, 3], [3 * DAY, 4]])
+
+    def test_series_overlap(self):
+        # The bucket at the boundary is partial in the chunk ending there.
+        parts = [
+            [[0, 5], [DAY, 6], [2 * DAY, 1]],
+            [[2 * DAY, 7], [3 * DAY, 8]],
+            [],
+            [[3 * DAY, 9], [4 * DAY, 10]],
+        ]
+        self.assertEqual(oc.merge_series(parts), [
+            [0, 5], [DAY, 6], [2 * DAY, 7], [3 * DAY, 9], [4 * DAY, 10],
+        ])
+
+    def test_series_empty(self):
+        self.assertEqual(oc.merge_series([]), [])
+        self.assertEqual(oc.merge_series([[], [[0, 1]], []]), [[0, 1]])
+
+    def test_totals(self):
+        a = { "apps": { "a1": { "views": 10, "downloads": 1 } },
+              "currency": "USD" }
+        b = { "apps": { "a1": { "views": 5 }, "a2": { "views": 2 } },
+              "currency": "EUR" }
+        self.assertEqual(oc.merge_totals(a, b), {
+            "apps": {
+                "a1": { "views": 15, "downloads": 1 },
+                "a2": { "views": 2 },
+            },
+            "currency": "EUR",
+        })
+        # Neither input is changed.
+        self.assertEqual(a["apps"]["a1"]["views"], 10)
+
+if __name__ == "__main__":
+    unittest.main()
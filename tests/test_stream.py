@@ -0,0 +1,83 @@
+"""
+ListStream, and Client's stream_* calls against the benchmarks' mock
+server.
+"""
+
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "benchmarks"))
+
+import openchannel as oc
+
+from mockserver import MockServer
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+class ListStreamTest(unittest.TestCase):
+
+    docs = [
+        { "count": 3, "list": [{ "a": 1 }, { "b": [1, 2, "xé"] }, 3.25],
+          "pages": 1 },
+        {},
+        { "list": [] },
+        { "x": { "y": 1 }, "list": [1, 2, 3, 12345, -1e10, True, None] },
+    ]
+
+    def test_chunks(self):
+        for doc in self.docs:
+            data = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+            meta = { k: v for k, v in doc.items() if k != "list" }
+            # Chunks of one byte split every number and UTF-8 sequence.
+            for size in (1, 2, 3, 7, len(data)):
+                stream = oc.ListStream(split(data, size))
+                self.assertEqual(list(stream), doc.get("list", []))
+                self.assertEqual(stream.meta, meta)
+
+    def test_feed(self):
+        for doc in self.docs:
+            data = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+            for size in (1, 5, len(data)):
+                stream = oc.ListStream()
+                values = []
+                for chunk in split(data, size):
+                    stream.feed(chunk)
+                    values.extend(stream.ready())
+                stream.feed(b"", final=True)
+                values.extend(stream.ready())
+                self.assertEqual(values, doc.get("list", []))
+
+    def test_truncated(self):
+        for data in [b'{"list":[1,2', b'{"list":[1,2]']:
+            with self.assertRaises(ValueError):
+                list(oc.ListStream(split(data, 3)))
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        # More rows than the mock's default page of 100.
+        self.server = MockServer(items=250, payload=100).start()
+        self.cli = oc.Client("marketplace", "secret")
+        self.cli.base = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_pages(self):
+        paged = [v.fields() for v in self.cli.iter_transactions(limit=100)]
+        streamed = [v.fields()
+                    for v in self.cli.stream_transactions(limit=100)]
+        self.assertEqual(len(streamed), 250)
+        self.assertEqual(streamed, paged)
+
+    def test_default_limit(self):
+        self.assertEqual(len(list(self.cli.stream_ownership())), 250)
+        self.assertEqual(len(list(self.cli.stream_apps(limit=60))), 250)
+
+if __name__ == "__main__":
+    unittest.main()
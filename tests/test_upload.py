@@ -0,0 +1,75 @@
+"""
+MultipartBody's headers, and uploads to the benchmarks' mock server.
+"""
+
+import os
+import sys
+import email
+import email.policy
+import unittest
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "benchmarks"))
+
+import openchannel as oc
+
+from mockserver import MockServer
+
+def part(body):
+    """
+    The headers of body's one part, as an email message.
+    """
+    data = b"".join(bytes(c) for c in body)
+    head = data.split(b"\r\n", 1)[1].split(b"\r\n\r\n", 1)[0]
+    return email.message_from_bytes(head + b"\r\n\r\n",
+                                    policy=email.policy.HTTP)
+
+class MultipartBodyTest(unittest.TestCase):
+
+    def test_plain(self):
+        msg = part(oc.MultipartBody("dir/a.bin", b"xyz"))
+        self.assertEqual(msg["Content-Disposition"],
+                         'form-data; name="dir/a.bin"; filename="a.bin"')
+
+    def test_quotes(self):
+        name = 'say "hi" \\o.txt'
+        msg = part(oc.MultipartBody(name, b"xyz"))
+        self.assertEqual(msg.get_filename(), name)
+        self.assertEqual(msg.get_param("name", header="Content-Disposition"),
+                         name)
+
+    def test_non_ascii(self):
+        name = "résumé 履歴書.pdf"
+        body = oc.MultipartBody(name, b"xyz")
+        head = bytes(body.parts[0]).decode("utf-8")
+        encoded = head.split("filename*=UTF-8''")[1].split("\r\n")[0]
+        self.assertEqual(urllib.parse.unquote(encoded), name)
+        self.assertIn(b'filename="r_sum_ ___.pdf"; filename*=UTF-8\'\''
+                      b'r%C3%A9sum%C3%A9%20%E5%B1%A5%E6%AD%B4%E6%9B%B8.pdf',
+                      bytes(body.parts[0]))
+
+    def test_line_break(self):
+        for name in ["a.bin\r\nX-Evil: 1", "a\n.bin", "a\r.bin"]:
+            with self.assertRaises(ValueError):
+                oc.MultipartBody(name, b"xyz")
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer(items=10, payload=10).start()
+        self.cli = oc.Client("marketplace", "secret")
+        self.cli.base = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_upload(self):
+        name = 'über "quoted".bin'
+        body = oc.MultipartBody(name, b"x" * 1000)
+        file = self.cli.upload_file(name, b"x" * 1000)
+        self.assertEqual(file.size, len(body))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Conditional GETs through ValidatorCache, against a local server which
+sends an ETag and answers If-None-Match with 304.
+"""
+
+import os
+import sys
+import json
+import threading
+import unittest
+import http.server
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import openchannel as oc
+
+class EtagServer:
+    """
+    Serves one app whose name and ETag the test can change, and counts
+    the 200s and 304s sent.  on_304, if set, is called before a 304.
+    """
+
+    def __init__(self):
+        self.etag = '"v1"'
+        self.name = "First"
+        self.sent = []
+        self.on_304 = None
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), self.handler()
+        )
+        self.server.daemon_threads = True
+        threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        ).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/v2" % self.server.server_address[1]
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler(self):
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.headers.get("If-None-Match") == server.etag:
+                    if server.on_304 != None:
+                        server.on_304()
+                    server.sent.append(304)
+                    self.send_response(304)
+                    self.send_header("ETag", server.etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps({
+                    "appId": "a1", "name": server.name, "version": 1,
+                }).encode("utf-8")
+                server.sent.append(200)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", server.etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+class ValidatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EtagServer()
+        self.validators = oc.ValidatorCache()
+        self.cli = oc.Client("marketplace", "secret",
+                             validators=self.validators)
+        self.cli.base = self.server.url
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_not_modified(self):
+        self.assertEqual(self.cli.get_app("a1").name, "First")
+        self.assertEqual(self.cli.get_app("a1").name, "First")
+        self.assertEqual(self.server.sent, [200, 304])
+        stats = self.validators.stats()
+        self.assertEqual(stats["not_modified"], 1)
+        self.assertGreater(stats["bytes_saved"], 0)
+
+    def test_changed(self):
+        self.cli.get_app("a1")
+        self.cli.get_app("a1")
+        self.server.etag = '"v2"'
+        self.server.name = "Second"
+        self.assertEqual(self.cli.get_app("a1").name, "Second")
+        self.assertEqual(self.cli.get_app("a1").name, "Second")
+        self.assertEqual(self.server.sent, [200, 304, 200, 304])
+
+    def test_copies(self):
+        # Changing a result mustn't change what a 304 is served from.
+        first = self.cli.get_app("a1")
+        first.name = "Changed"
+        self.assertEqual(self.cli.get_app("a1").name, "First")
+
+    def test_evicted(self):
+        self.cli.get_app("a1")
+        # The entry is dropped after the request was made conditional, so
+        # the 304 has nothing to be served from and the app is refetched.
+        self.server.on_304 = self.validators.entries.clear
+        self.assertEqual(self.cli.get_app("a1").name, "First")
+        self.assertEqual(self.server.sent, [200, 304, 200])
+        self.assertEqual(self.validators.stats()["not_modified"], 0)
+
+if __name__ == "__main__":
+    unittest.main()